@@ -0,0 +1,78 @@
+"""Пропускная способность записи при параллельных add_participant.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_add_participant --taps 2000 --concurrency 100
+
+База создаётся во временном каталоге; BENCH_DIR задаёт другой каталог (например, на реальном диске).
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database import Database, EngineProfile
+
+# Профиль: (настройки движка, окно пакетной записи откликов в миллисекундах)
+PROFILES = {
+    # Движок SQLite без PRAGMA и пула — как до появления EngineProfile
+    "default": (EngineProfile(sqlite_pragmas=False), 0),
+    "tuned": (EngineProfile(), 0),
+    "batched": (EngineProfile(), 10),
+}
+
+
+async def run(profile_name: str, taps: int, concurrency: int, events: int) -> tuple:
+    directory = tempfile.mkdtemp(dir=os.environ.get("BENCH_DIR"))
+    engine_profile, batch_ms = PROFILES[profile_name]
+    db = Database(
+        f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}",
+        engine_profile=engine_profile,
+        participant_batch_ms=batch_ms
+    )
+    await db.init_db()
+
+    event_ids = []
+    for number in range(events):
+        event = await db.create_event(number, f"Мероприятие {number}", datetime.now() + timedelta(days=1), None, "", "")
+        event_ids.append(event.id)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def tap(user_id: int):
+        nonlocal errors
+        async with semaphore:
+            try:
+                await db.add_participant(event_ids[user_id % events], user_id, None, f"Пользователь {user_id}")
+            except Exception:
+                # Писатель не дождался блокировки ("database is locked") — нажатие потеряно
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(tap(user_id) for user_id in range(taps)))
+    elapsed = time.perf_counter() - started
+
+    await db.close()
+    return (taps - errors) / elapsed, errors
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--taps", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--events", type=int, default=5)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args()
+
+    for profile_name in args.profiles:
+        throughput, errors = await run(profile_name, args.taps, args.concurrency, args.events)
+        print(
+            f"{profile_name:>8}: {throughput:8.1f} успешных add_participant/с, ошибок: {errors} "
+            f"({args.taps} нажатий, {args.concurrency} параллельно)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
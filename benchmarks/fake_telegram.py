@@ -0,0 +1,84 @@
+"""Локальная замена Telegram Bot API для нагрузочных тестов: отвечает на методы бота без обращения к сети."""
+import asyncio
+import itertools
+import time
+from collections import Counter
+from typing import Optional, Set
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+
+BOT_ID = 42
+BOT_TOKEN = f"{BOT_ID}:fake-token"
+
+
+class FakeTelegramServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        # Искусственная задержка ответа, чтобы имитировать сеть до api.telegram.org
+        self.latency = latency
+        self.calls: Counter = Counter()
+        # Пользователи, заблокировавшие бота: sendMessage им отвечает 403
+        self.blocked: Set[int] = set()
+        self._message_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def create_bot(self) -> Bot:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.base_url))
+        return Bot(BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _message(self, chat_id: str, text: str = "") -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private" if int(chat_id) > 0 else "supergroup"},
+            "text": text,
+        }
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        fields = await request.post()
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            result = {"id": BOT_ID, "is_bot": True, "first_name": "Fake bot", "username": "fake_bot"}
+        elif method == "sendMessage" and int(fields["chat_id"]) in self.blocked:
+            return web.json_response(
+                {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"},
+                status=403
+            )
+        elif method == "sendMessage":
+            result = self._message(fields["chat_id"], fields.get("text", ""))
+        elif method == "getUpdates":
+            # Обновления в нагрузочных тестах подаются напрямую в диспетчер; long polling получает пустой ответ
+            await asyncio.sleep(min(float(fields.get("timeout", 0)), 1.0))
+            result = []
+        elif method in ("editMessageReplyMarkup", "editMessageText"):
+            result = self._message(fields.get("chat_id", "1"), fields.get("text", ""))
+        else:
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
@@ -0,0 +1,305 @@
+"""Нагрузочный тест бота против локальной замены Telegram Bot API.
+
+Сценарии:
+  callbacks — тысячи одновременных нажатий «🔔 Напомнить» (event:remind)
+  list      — серия команд /list от администраторов
+  reminder  — рассылка одного напоминания большому числу участников
+  retry     — проверка: пользователь нажимает кнопки чаще лимита, а когда окно THROTTLE_WINDOW проходит, повторяет
+              отклонённые нажатия — каждое должно записать его в участники
+
+Запуск из корня репозитория:
+    python -m benchmarks.loadtest --scenarios callbacks list reminder --taps 2000 --participants 10000
+
+Диспетчер и база собираются теми же функциями, что и в main.py, с настройками из окружения (.env),
+поэтому FSM_STORAGE, THROTTLE_*, PARTICIPANT_WRITE_BATCH_MS и т.п. влияют на результаты так же, как в работе бота.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List
+from zoneinfo import ZoneInfo
+
+from aiogram.types import Update
+from sqlalchemy import event as sa_event, insert, select
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from bot.counter_updater import CounterUpdater
+from config import config
+from database import Database, Participant
+from delivery import FanOutSender, ShardedSender
+from main import create_database, create_dispatcher
+from scheduler import ReminderScheduler, build_reminder_rules
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+ADMIN_ID = 1
+GROUP_CHAT_ID = -1001000000000
+# Анонсы мероприятий — сообщения ANNOUNCE_MESSAGE_BASE, ANNOUNCE_MESSAGE_BASE + 1, ... в GROUP_CHAT_ID
+ANNOUNCE_MESSAGE_BASE = 1000
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    operations: int
+    duration: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    api_calls: int = 0
+    messages_sent: int = 0
+    db_queries: int = 0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    def report(self) -> str:
+        duration = self.duration or 1e-9
+        return (
+            f"{self.name:>10}: {self.operations} операций за {self.duration:.2f} с "
+            f"({self.operations / duration:.0f} оп./с), "
+            f"p50={self.percentile(50) * 1000:.1f} мс, p99={self.percentile(99) * 1000:.1f} мс, "
+            f"сообщений: {self.messages_sent} ({self.messages_sent / duration:.0f}/с), "
+            f"вызовов API: {self.api_calls}, запросов к БД: {self.db_queries} "
+            f"({self.db_queries / max(self.operations, 1):.1f} на операцию)"
+        )
+
+
+class QueryCounter:
+    def __init__(self, db: Database):
+        self.count = 0
+        sa_event.listen(db.engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+class LoadTest:
+    def __init__(self, server: FakeTelegramServer, db: Database):
+        self.server = server
+        self.db = db
+        self.bot = server.create_bot()
+        self.queries = QueryCounter(db)
+        self.scheduler = ReminderScheduler(self.bot, db)
+        self.counter_updater = CounterUpdater(self.bot, db, interval=config.KEYBOARD_UPDATE_INTERVAL)
+        # Диспетчер собирается так же, как в main.py: FSM-хранилище, защита от флуда и прочие настройки из config
+        db_ready = asyncio.get_running_loop().create_future()
+        db_ready.set_result(None)
+        self.dp, self.throttle_store = create_dispatcher(self.bot, db, db_ready)
+        self._update_ids = iter(range(1, 10 ** 9))
+        self._announce_ids = iter(range(ANNOUNCE_MESSAGE_BASE, 10 ** 9))
+        self.announcements: Dict[int, int] = {}
+
+    async def create_event(self, participants: int = 0, starts_in: timedelta = timedelta(days=2)) -> int:
+        date_time = datetime.now(MOSCOW_TZ) + starts_in
+        created = await self.db.create_event(
+            event_number=await self.db.next_event_number(),
+            title="Нагрузочное мероприятие",
+            date_time=date_time,
+            end_time=None,
+            address="Москва",
+            description="",
+            message_id=next(self._announce_ids),
+            chat_id=GROUP_CHAT_ID,
+            reminder_rules=build_reminder_rules(date_time, "Нагрузочное мероприятие", "Москва")
+        )
+        self.announcements[created.id] = created.message_id
+        if participants:
+            async with self.db.session_maker() as session:
+                await session.execute(insert(Participant), [
+                    {
+                        "event_id": created.id,
+                        "user_id": 10 ** 6 + user_id,
+                        "username": f"user{user_id}",
+                        "fullname": f"Пользователь {user_id}",
+                        "timestamp": datetime.now()
+                    }
+                    for user_id in range(participants)
+                ])
+                await session.commit()
+        return created.id
+
+    def callback_update(self, event_id: int, user_id: int) -> Update:
+        return Update.model_validate({
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(user_id),
+                "from": {"id": user_id, "is_bot": False, "first_name": f"Пользователь {user_id}"},
+                "chat_instance": "1",
+                "data": "event:remind",
+                "message": {
+                    "message_id": self.announcements[event_id],
+                    "date": 0,
+                    "chat": {"id": GROUP_CHAT_ID, "type": "supergroup"},
+                    "text": "Анонс"
+                }
+            }
+        })
+
+    def command_update(self, text: str, user_id: int = ADMIN_ID) -> Update:
+        return Update.model_validate({
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._update_ids),
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Админ"},
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+            }
+        })
+
+    async def feed(self, updates: List[Update], concurrency: int, result: ScenarioResult):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def handle(update: Update):
+            async with semaphore:
+                started = time.perf_counter()
+                await self.dp.feed_update(
+                    self.bot,
+                    update,
+                    db=self.db,
+                    scheduler=self.scheduler,
+                    counter_updater=self.counter_updater
+                )
+                result.latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(handle(update) for update in updates))
+
+    async def measure(self, result: ScenarioResult, workload) -> ScenarioResult:
+        api_calls = sum(self.server.calls.values())
+        messages = self.server.calls["sendMessage"]
+        queries = self.queries.count
+
+        started = time.perf_counter()
+        await workload
+        result.duration = time.perf_counter() - started
+
+        result.api_calls = sum(self.server.calls.values()) - api_calls
+        result.messages_sent = self.server.calls["sendMessage"] - messages
+        result.db_queries = self.queries.count - queries
+        return result
+
+    async def scenario_callbacks(self, taps: int, concurrency: int) -> ScenarioResult:
+        event_id = await self.create_event()
+        updates = [self.callback_update(event_id, 10 ** 7 + user_id) for user_id in range(taps)]
+        result = ScenarioResult("callbacks", taps)
+        return await self.measure(result, self.feed(updates, concurrency, result))
+
+    async def scenario_list(self, calls: int, events: int, participants: int, concurrency: int) -> ScenarioResult:
+        for _ in range(events):
+            await self.create_event(participants)
+        # Команды от разных администраторов: иначе почти все упрутся в защиту от флуда
+        updates = [self.command_update("/list", ADMIN_ID + number) for number in range(calls)]
+        result = ScenarioResult("list", calls)
+        return await self.measure(result, self.feed(updates, concurrency, result))
+
+    async def deliver_due_reminders(self):
+        # Тик планировщика только ставит напоминания в очередь и запускает рассылку в фоне — ждём её окончания
+        await self.scheduler.dispatch_due_reminders()
+        await self.scheduler.start_drain()
+
+    async def scenario_reminder(self, participants: int, rate: float, workers: int) -> ScenarioResult:
+        # Напоминание «за 3 часа» уже наступило — его поставит в очередь и разошлёт периодическая проверка
+        await self.create_event(participants, starts_in=timedelta(hours=3) - timedelta(minutes=1))
+        sender_options = dict(
+            global_rate=rate,
+            per_chat_rate=config.REMINDER_PER_CHAT_RATE,
+            concurrency=config.REMINDER_CONCURRENCY,
+            max_retries=config.REMINDER_MAX_RETRIES
+        )
+        if workers > 0:
+            self.scheduler.sender = ShardedSender(
+                self.bot, workers=workers, report_every=config.REMINDER_MARK_EVERY, **sender_options
+            )
+            # Запуск процессов не входит в замер
+            await asyncio.gather(*map(asyncio.wrap_future, self.scheduler.sender.warm_up()))
+        else:
+            self.scheduler.sender = FanOutSender(self.bot, **sender_options)
+        result = ScenarioResult("reminder", participants)
+        try:
+            await self.measure(result, self.deliver_due_reminders())
+        finally:
+            if workers > 0:
+                self.scheduler.sender.close()
+        result.latencies = [result.duration]
+        return result
+
+    async def scenario_retry(self, announcements: int) -> ScenarioResult:
+        user_id = 10 ** 8
+        event_ids = [await self.create_event() for _ in range(announcements)]
+        result = ScenarioResult("retry", announcements * 2)
+
+        async def workload():
+            await self.feed([self.callback_update(event_id, user_id) for event_id in event_ids], 1, result)
+            # Скользящее окно ещё частично учитывает прошлое окно: ждём, пока оно выйдет целиком
+            await asyncio.sleep(config.THROTTLE_WINDOW * 2)
+            await self.feed([self.callback_update(event_id, user_id) for event_id in event_ids], 1, result)
+
+        await self.measure(result, workload())
+        async with self.db.session_maker() as session:
+            signed_up = set((await session.execute(
+                select(Participant.event_id).where(Participant.user_id == user_id)
+            )).scalars())
+        missing = sorted(set(event_ids) - signed_up)
+        if missing:
+            raise AssertionError(f"Повторное нажатие не записало пользователя в мероприятия {missing}")
+        return result
+
+    async def close(self):
+        await self.counter_updater.close()
+        await self.dp.fsm.storage.close()
+        if self.throttle_store:
+            await self.throttle_store.close()
+        await self.bot.session.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=["callbacks", "list", "reminder"],
+                        choices=["callbacks", "list", "reminder", "retry"])
+    parser.add_argument("--taps", type=int, default=2000, help="нажатий в сценарии callbacks")
+    parser.add_argument("--list-calls", type=int, default=50, help="команд /list в сценарии list")
+    parser.add_argument("--list-events", type=int, default=20)
+    parser.add_argument("--list-participants", type=int, default=200, help="участников на мероприятие в сценарии list")
+    parser.add_argument("--participants", type=int, default=10000, help="получателей в сценарии reminder")
+    parser.add_argument("--rate", type=float, default=1000, help="лимит сообщений в секунду для сценария reminder")
+    parser.add_argument("--workers", type=int, default=0, help="процессов рассылки в сценарии reminder")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа фейкового API, с")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+
+    config.ADMIN_IDS = list(range(ADMIN_ID, ADMIN_ID + max(args.list_calls, 1)))
+
+    server = FakeTelegramServer(port=args.port, latency=args.api_latency)
+    await server.start()
+
+    directory = tempfile.mkdtemp(dir=os.environ.get("BENCH_DIR"))
+    db = create_database(f"sqlite+aiosqlite:///{os.path.join(directory, 'loadtest.db')}")
+    await db.init_db()
+
+    test = LoadTest(server, db)
+    try:
+        if "callbacks" in args.scenarios:
+            print((await test.scenario_callbacks(args.taps, args.concurrency)).report())
+        if "list" in args.scenarios:
+            print((await test.scenario_list(
+                args.list_calls, args.list_events, args.list_participants, args.concurrency
+            )).report())
+        if "retry" in args.scenarios:
+            print((await test.scenario_retry(config.THROTTLE_USER_LIMIT + 2)).report())
+        if "reminder" in args.scenarios:
+            print((await test.scenario_reminder(args.participants, args.rate, args.workers)).report())
+    finally:
+        await test.close()
+        await db.close()
+        await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
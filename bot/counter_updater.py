@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from bot.keyboards import get_event_keyboard
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+MessageKey = Tuple[int, int]
+
+
+class CounterUpdater:
+    """Схлопывает обновления счётчика на кнопке анонса: не чаще одного редактирования за interval"""
+
+    def __init__(self, bot: Bot, db: Database, interval: float = 3.0):
+        self.bot = bot
+        self.db = db
+        self.interval = interval
+        self._events: Dict[MessageKey, int] = {}
+        self._shown_counts: Dict[MessageKey, int] = {}
+        self._last_edit: Dict[MessageKey, float] = {}
+        self._tasks: Dict[MessageKey, asyncio.Task] = {}
+        self._dirty: Set[MessageKey] = set()
+
+    def schedule(self, chat_id: int, message_id: int, event_id: int):
+        key = (chat_id, message_id)
+        self._events[key] = event_id
+        self._dirty.add(key)
+        if key in self._tasks:
+            # Редактирование уже запланировано — оно покажет актуальное число
+            return
+
+        delay = max(0.0, self._last_edit.get(key, 0.0) + self.interval - time.monotonic())
+        self._tasks[key] = asyncio.create_task(self._flush(key, delay))
+
+    async def _flush(self, key: MessageKey, delay: float):
+        try:
+            await asyncio.sleep(delay)
+            self._dirty.discard(key)
+            event_id = self._events[key]
+            reminder_count = await self.db.count_participants(event_id)
+
+            # Число не изменилось — лишний запрос к Telegram не нужен
+            if self._shown_counts.get(key) != reminder_count:
+                chat_id, message_id = key
+                await self.bot.edit_message_reply_markup(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    reply_markup=get_event_keyboard(reminder_count=reminder_count)
+                )
+                self._shown_counts[key] = reminder_count
+        except TelegramRetryAfter as e:
+            # Пропускаем окно, которое просит Telegram, и пробуем ещё раз
+            self._last_edit[key] = time.monotonic() + e.retry_after
+            self._tasks.pop(key, None)
+            self.schedule(*key, self._events[key])
+            return
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.warning(f"Не удалось обновить кнопку сообщения {key}: {e}")
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении кнопки сообщения {key}: {e}")
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+        edited_at = self._last_edit[key] = time.monotonic()
+        if key in self._dirty:
+            # Пока шло редактирование, пришли новые нажатия
+            self.schedule(*key, self._events[key])
+            return
+
+        # Нажатий больше нет — сведения о сообщении не нужны, иначе они копятся по всем анонсам.
+        # Время правки нужно, только пока не прошёл interval
+        self._events.pop(key, None)
+        self._shown_counts.pop(key, None)
+        asyncio.get_running_loop().call_later(self.interval, self._forget_last_edit, key, edited_at)
+
+    def _forget_last_edit(self, key: MessageKey, edited_at: float):
+        # За это время сообщение могли снова отредактировать — тогда запись удалит следующий вызов
+        if key not in self._tasks and self._last_edit.get(key) == edited_at:
+            del self._last_edit[key]
+
+    async def close(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
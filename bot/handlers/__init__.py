@@ -1,3 +1,3 @@
-from . import event, callbacks, admin
+from . import event, callbacks, admin, start
 
-__all__ = ["event", "callbacks", "admin"]
+__all__ = ["event", "callbacks", "admin", "start"]
@@ -1,47 +1,135 @@
-from aiogram import Router
+from html import escape
+from typing import Optional, Tuple
+
+from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.types import CallbackQuery, Message
 
+from bot.keyboards import get_participants_list_keyboard, get_participants_page_keyboard
 from config import config
-from database import Database
+from database import Database, Event, Participant
 
 router = Router()
 
+# Лимит Telegram на длину сообщения
+MESSAGE_LIMIT = 4096
+# Сколько места в сводке /list может занять список участников одного мероприятия
+PREVIEW_LIMIT = 1500
+PAGE_SIZE = 50
+BLOCK_SEPARATOR = "\n\n➖➖➖\n\n"
+
 
 def is_admin(user_id: int) -> bool:
     return user_id in config.ADMIN_IDS
 
 
+def format_participant(participant: Participant, limit: Optional[int] = None) -> str:
+    """Имя участника для HTML-сообщения; с limit — не длиннее limit символов после экранирования"""
+    name = f"@{participant.username}" if participant.username else participant.fullname
+    text = escape(name)
+    if limit is None or len(text) <= limit:
+        return text
+
+    # Обрезаем до экранирования, чтобы не разрезать HTML-сущность
+    while name and len(escape(name)) + 1 > limit:
+        name = name[:-1]
+    return escape(name) + "…"
+
+
+def format_event_block(event: Event) -> Tuple[str, bool]:
+    """Текст мероприятия для /list и признак того, что список участников обрезан"""
+    block = f"📊 <b>Мероприятие:</b> {escape(event.title)}\n"
+    block += f"📅 <b>{event.date_time.strftime('%d.%m.%Y %H:%M')}</b>\n\n"
+    block += f"🔔 <b>Включили напоминание ({len(event.participants)}):</b>\n"
+
+    if not event.participants:
+        return block + "Пока никто не активировал напоминания", False
+
+    names = []
+    length = 0
+    for participant in event.participants:
+        name = format_participant(participant)
+        if length + len(name) + 2 > PREVIEW_LIMIT:
+            break
+        names.append(name)
+        length += len(name) + 2
+
+    block += ", ".join(names)
+    hidden = len(event.participants) - len(names)
+    if hidden:
+        block += f" и ещё {hidden}"
+    return block, hidden > 0
+
+
 @router.message(Command("list"))
 async def cmd_list(message: Message, db: Database):
     if not is_admin(message.from_user.id):
         await message.answer("У вас нет прав для просмотра участников.")
         return
 
-    events = await db.get_upcoming_events()
+    events = await db.get_upcoming_events_with_participants()
 
     if not events:
         await message.answer("Нет предстоящих мероприятий.")
         return
 
+    # Собираем блоки мероприятий в как можно меньшее число сообщений
+    chunk = ""
+    truncated = []
     for event in events:
-        participants = await db.get_participants_by_event(event.id)
+        block, is_truncated = format_event_block(event)
+        if chunk and len(chunk) + len(BLOCK_SEPARATOR) + len(block) > MESSAGE_LIMIT:
+            await message.answer(chunk, parse_mode="HTML", reply_markup=get_participants_list_keyboard(truncated))
+            chunk = ""
+            truncated = []
 
-        participant_list = [
-            f"@{p.username}" if p.username else p.fullname
-            for p in participants
-        ]
+        chunk = chunk + BLOCK_SEPARATOR + block if chunk else block
+        if is_truncated:
+            truncated.append((event.id, event.title, len(event.participants)))
 
-        response = f"📊 <b>Мероприятие:</b> {event.title}\n"
-        response += f"📅 <b>{event.date_time.strftime('%d.%m.%Y %H:%M')}</b>\n\n"
+    await message.answer(chunk, parse_mode="HTML", reply_markup=get_participants_list_keyboard(truncated))
 
-        response += f"🔔 <b>Включили напоминание ({len(participants)}):</b>\n"
-        if participant_list:
-            response += ", ".join(participant_list)
-        else:
-            response += "Пока никто не активировал напоминания"
 
-        await message.answer(response, parse_mode="HTML")
+@router.callback_query(F.data.startswith("list:"))
+async def handle_participants_page(callback: CallbackQuery, db: Database):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("У вас нет прав для просмотра участников.", show_alert=True)
+        return
+
+    # list:<id> — открыть список новым сообщением, list:<id>:<страница> — листать уже открытый
+    parts = callback.data.split(":")
+    event_id = int(parts[1])
+    page = int(parts[2]) if len(parts) > 2 else 0
+
+    event = await db.get_event(event_id)
+    if not event:
+        await callback.answer("Мероприятие не найдено", show_alert=True)
+        return
+
+    total = await db.count_participants(event_id)
+    pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    participants = await db.get_participants_page(event_id, page * PAGE_SIZE, PAGE_SIZE)
+
+    text = (
+        f"📊 <b>Мероприятие:</b> {escape(event.title)}\n"
+        f"🔔 <b>Включили напоминание ({total})</b>, страница {page + 1} из {pages}:\n\n"
+    )
+    # Страница из PAGE_SIZE строк должна уместиться в сообщение: на строку приходится равная доля
+    # оставшегося места, слишком длинные имена обрезаются
+    line_limit = (MESSAGE_LIMIT - len(text)) // PAGE_SIZE - 1
+    lines = []
+    for number, participant in enumerate(participants, start=page * PAGE_SIZE + 1):
+        prefix = f"{number}. "
+        lines.append(prefix + format_participant(participant, line_limit - len(prefix)))
+    text += "\n".join(lines)
+    keyboard = get_participants_page_keyboard(event_id, page, pages)
+
+    if len(parts) > 2:
+        await callback.message.edit_text(text, parse_mode="HTML", reply_markup=keyboard)
+    else:
+        await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
+    await callback.answer()
 
 
 @router.message(Command("clear_events"))
@@ -50,5 +138,8 @@ async def cmd_clear_events(message: Message, db: Database):
         await message.answer("У вас нет прав для удаления мероприятий.")
         return
 
-    await db.delete_old_events()
-    await message.answer("✅ Старые мероприятия удалены.")
+    deleted_events, deleted_participants = await db.delete_old_events(batch_size=config.CLEANUP_BATCH_SIZE)
+    await message.answer(
+        f"✅ Старые мероприятия удалены.\n"
+        f"Мероприятий: {deleted_events}, записей участников: {deleted_participants}"
+    )
@@ -1,50 +1,82 @@
+from datetime import timedelta
+from typing import List
+
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 
-from database import Database
-from bot.keyboards import get_event_keyboard
+from database import Database, ReminderRule
+from bot.counter_updater import CounterUpdater
+from delivery import is_undeliverable
+from scheduler import format_offset
 
 router = Router()
 
 
+def format_reminder_offsets(rules: List[ReminderRule]) -> str:
+    """'за 1 день и за 3 часа' — смещения напоминаний, сохранённых для мероприятия.
+    Настройки чата могли измениться после публикации анонса, а отправлены будут именно эти напоминания"""
+    offsets = sorted((rule.offset_minutes for rule in rules), reverse=True)
+    items = [f"за {format_offset(timedelta(minutes=minutes))}" for minutes in offsets]
+    if len(items) > 1:
+        return f"{', '.join(items[:-1])} и {items[-1]}"
+    return items[0] if items else ""
+
+
 @router.callback_query(F.data.startswith("event:"))
-async def handle_event_response(callback: CallbackQuery, db: Database):
+async def handle_event_response(callback: CallbackQuery, db: Database, counter_updater: CounterUpdater):
     try:
-        _, event_id_str, action = callback.data.split(":")
-        event_id = int(event_id_str)
+        # event:remind — кнопка анонса; event:<id>:remind — кнопка анонсов, опубликованных до этого формата
+        parts = callback.data.split(":")
+        action = parts[-1]
 
-        if action != "remind":
+        if action != "remind" or len(parts) not in (2, 3):
             await callback.answer("Неизвестное действие", show_alert=True)
             return
 
+        # Мероприятие определяется по сообщению с анонсом
+        event = None
+        if callback.message:
+            event = await db.get_event_by_message(callback.message.chat.id, callback.message.message_id)
+        linked = event is not None
+        if event is None and len(parts) == 3:
+            event = await db.get_event(int(parts[1]))
+        if event is None:
+            # Нажатие могло прийти, пока мероприятие только что опубликованного анонса ещё сохраняется
+            await callback.answer(
+                "Мероприятие не найдено. Если анонс только что опубликован, нажмите ещё раз через пару секунд",
+                show_alert=True
+            )
+            return
+
         user = callback.from_user
         fullname = user.full_name
         username = user.username
 
         await db.add_participant(
-            event_id=event_id,
+            event_id=event.id,
             user_id=user.id,
             username=username,
             fullname=fullname
         )
 
-        participants = await db.get_participants_by_event(event_id)
-
-        new_keyboard = get_event_keyboard(
-            event_id,
-            reminder_count=len(participants)
-        )
+        # Счётчик на кнопке обновится отложенно, одним редактированием на пачку нажатий. Новая кнопка
+        # не содержит id, поэтому старый анонс, не привязанный к мероприятию в базе, не перерисовываем
+        if linked:
+            counter_updater.schedule(callback.message.chat.id, callback.message.message_id, event.id)
 
-        await callback.message.edit_reply_markup(reply_markup=new_keyboard)
         await callback.answer("✅ Напоминание активировано!")
 
-        try:
-            await callback.bot.send_message(
-                chat_id=user.id,
-                text="✅ Отлично! Бот напомнит вам о мероприятии за 24 часа и за 3 часа до начала встречи."
-            )
-        except Exception:
-            pass
+        # Пользователю, который не запускал бота или заблокировал его, не пишем, пока он не отправит /start
+        offsets = format_reminder_offsets(event.reminder_rules)
+        if offsets and await db.is_deliverable(user.id):
+            try:
+                await callback.bot.send_message(
+                    chat_id=user.id,
+                    text=f"✅ Отлично! Бот напомнит вам о мероприятии {offsets} до начала встречи."
+                )
+            except Exception as e:
+                if is_undeliverable(e):
+                    await db.mark_undeliverable({user.id: str(e)})
 
     except Exception as e:
         await callback.answer(f"Произошла ошибка: {str(e)}", show_alert=True)
@@ -1,3 +1,4 @@
+import logging
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from aiogram import Router
@@ -9,10 +10,13 @@ from bot.states import EventCreation
 from bot.keyboards import get_event_keyboard, get_chat_selection_keyboard
 from config import config
 from database import Database
+from scheduler import build_reminder_rules, format_offset, offsets_for_chat
 
 # Московский часовой пояс
 MOSCOW_TZ = ZoneInfo("Europe/Moscow")
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 
 
@@ -86,7 +90,7 @@ async def process_title(message: Message, state: FSMContext):
 
 
 @router.message(EventCreation.waiting_for_datetime)
-async def process_datetime(message: Message, state: FSMContext, db: Database, scheduler):
+async def process_datetime(message: Message, state: FSMContext, db: Database):
     try:
         # Получаем текущее московское время
         moscow_now = datetime.now(MOSCOW_TZ)
@@ -104,45 +108,52 @@ async def process_datetime(message: Message, state: FSMContext, db: Database, sc
 
         data = await state.get_data()
 
-        # Автоматически генерируем номер мероприятия на основе количества существующих
-        events = await db.get_all_events()
-        event_number = len(events) + 1
-
-        event = await db.create_event(
-            event_number=event_number,
-            title=data["title"],
-            date_time=event_datetime,
-            end_time=None,
-            address="",
-            description=""
-        )
+        # Автоматически генерируем следующий номер мероприятия
+        event_number = await db.next_event_number()
 
         event_text = (
             f"Если вы хотите чтобы вам напомнили про мероприятие, то нажмите на кнопку ниже и активируйте бот"
         )
 
         try:
+            # Сначала публикуем анонс, потом коротко сохраняем мероприятие вместе со ссылкой на него:
+            # транзакция не ждёт ответа Telegram и не держит блокировку базы
             sent_message = await message.bot.send_message(
                 chat_id=data["chat_id"],
                 text=event_text,
                 parse_mode="HTML",
-                reply_markup=get_event_keyboard(event.id)
+                reply_markup=get_event_keyboard()
             )
 
-            async with db.session_maker() as session:
-                db_event = await session.get(event.__class__, event.id)
-                db_event.message_id = sent_message.message_id
-                db_event.chat_id = data["chat_id"]
-                await session.commit()
-
-            scheduler.schedule_reminders(event.id, event.date_time)
-
+            try:
+                await db.create_event(
+                    event_number=event_number,
+                    title=data["title"],
+                    date_time=event_datetime,
+                    end_time=None,
+                    address="",
+                    description="",
+                    message_id=sent_message.message_id,
+                    chat_id=sent_message.chat.id,
+                    reminder_rules=build_reminder_rules(event_datetime, data["title"], "", data["chat_id"])
+                )
+            except Exception:
+                # Анонс без мероприятия в базе не должен оставаться в чате
+                try:
+                    await message.bot.delete_message(sent_message.chat.id, sent_message.message_id)
+                except Exception as e:
+                    logger.warning(f"Не удалось удалить анонс несохранённого мероприятия: {e}")
+                raise
+
+            # Напоминания отправит периодическая проверка планировщика, отдельные задания не нужны
+            reminders = "\n".join(
+                f"   • За {format_offset(offset)} до начала" for offset in offsets_for_chat(data["chat_id"]).values()
+            )
             await message.answer(
                 f"✅ Мероприятие успешно создано!\n\n"
                 f"📢 Анонс опубликован в чате: {data['chat_name']}\n"
                 f"🔔 Напоминания запланированы:\n"
-                f"   • За 24 часа до начала\n"
-                f"   • За 3 часа до начала"
+                f"{reminders}"
             )
         except Exception as e:
             await message.answer(f"❌ Ошибка при публикации: {str(e)}")
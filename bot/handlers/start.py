@@ -0,0 +1,17 @@
+from aiogram import Router
+from aiogram.filters import CommandStart
+from aiogram.types import Message
+
+from database import Database
+
+router = Router()
+
+
+@router.message(CommandStart())
+async def cmd_start(message: Message, db: Database):
+    # Пользователь сам написал боту — значит, теперь ему можно присылать напоминания
+    await db.clear_undeliverable(message.from_user.id)
+    await message.answer(
+        "👋 Привет! Нажмите «🔔 Напомнить» под анонсом мероприятия в чате сообщества, "
+        "и я пришлю напоминание перед началом встречи."
+    )
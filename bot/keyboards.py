@@ -1,18 +1,48 @@
+from typing import Optional
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 
 
-def get_event_keyboard(event_id: int, reminder_count: int = 0) -> InlineKeyboardMarkup:
+def get_event_keyboard(reminder_count: int = 0) -> InlineKeyboardMarkup:
+    # Мероприятие определяется по сообщению с анонсом, поэтому id в кнопке не нужен и анонс можно
+    # опубликовать до сохранения мероприятия. Старые анонсы с кнопками event:<id>:remind продолжают работать
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(
                 text=f"🔔 Напомнить ({reminder_count})",
-                callback_data=f"event:{event_id}:remind"
+                callback_data="event:remind"
             )
         ]
     ])
     return keyboard
 
 
+def get_participants_list_keyboard(events: list) -> Optional[InlineKeyboardMarkup]:
+    # events — список (event_id, название, число участников) для мероприятий, чей список не поместился
+    if not events:
+        return None
+    buttons = []
+    for event_id, title, count in events:
+        buttons.append([
+            InlineKeyboardButton(
+                text=f"👥 {title[:40]} — все участники ({count})",
+                callback_data=f"list:{event_id}"
+            )
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_participants_page_keyboard(event_id: int, page: int, pages: int) -> Optional[InlineKeyboardMarkup]:
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="◀️", callback_data=f"list:{event_id}:{page - 1}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton(text="▶️", callback_data=f"list:{event_id}:{page + 1}"))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+
 def get_chat_selection_keyboard(chats: dict) -> ReplyKeyboardMarkup:
     buttons = []
     for chat_name in chats.keys():
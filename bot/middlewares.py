@@ -0,0 +1,57 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Router
+from aiogram.types import TelegramObject
+
+from metrics import HANDLER_LATENCY
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Замеряет время работы каждого хендлера роутера"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=name, status=status)
+
+
+def setup_metrics_middleware(*routers: Router):
+    middleware = MetricsMiddleware()
+    for router in routers:
+        router.message.middleware(middleware)
+        router.callback_query.middleware(middleware)
+
+
+class StartupGateMiddleware(BaseMiddleware):
+    """Задерживает обновления, пока база не готова: приём обновлений начинается сразу после старта,
+    а инициализация идёт в фоне. Если она завершилась ошибкой, ошибка поднимается в каждом обновлении"""
+
+    def __init__(self, ready: "asyncio.Future[None]"):
+        self.ready = ready
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not self.ready.done():
+            await asyncio.shield(self.ready)
+        else:
+            self.ready.result()
+        return await handler(event, data)
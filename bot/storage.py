@@ -0,0 +1,69 @@
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from database import Database
+
+
+class DatabaseStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states: переживает перезапуск и общее для нескольких процессов бота"""
+
+    def __init__(self, db: Database, ttl: int = 86400):
+        self.db = db
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        self._last_purge = 0.0
+
+    def _expired_before(self) -> datetime:
+        return datetime.now() - timedelta(seconds=self.ttl)
+
+    async def _purge_expired(self):
+        # Брошенные на полпути мастера удаляем не чаще раза в час
+        if time.monotonic() - self._last_purge < min(self.ttl, 3600):
+            return
+        self._last_purge = time.monotonic()
+        await self.db.delete_expired_fsm_records(self._expired_before())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.db.save_fsm_record(
+            self.key_builder.build(key),
+            self._expired_before(),
+            state=state.state if isinstance(state, State) else state
+        )
+        await self._purge_expired()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self.db.get_fsm_record(self.key_builder.build(key), self._expired_before())
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.db.save_fsm_record(
+            self.key_builder.build(key),
+            self._expired_before(),
+            data=json.dumps(data, ensure_ascii=False)
+        )
+        await self._purge_expired()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self.db.get_fsm_record(self.key_builder.build(key), self._expired_before())
+        return json.loads(record.data) if record else {}
+
+    async def close(self) -> None:
+        pass
+
+
+def create_fsm_storage(kind: str, db: Database, ttl: int, redis_url: Optional[str] = None) -> BaseStorage:
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "database":
+        return DatabaseStorage(db, ttl=ttl)
+    if kind == "redis":
+        # redis — необязательная зависимость, нужна только для этого режима
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(redis_url, state_ttl=ttl, data_ttl=ttl)
+    raise ValueError(f"Неизвестный тип FSM-хранилища: {kind}")
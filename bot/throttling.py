@@ -0,0 +1,205 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Sequence, Set
+
+from aiogram import BaseMiddleware, Bot, Router
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import AnswerCallbackQuery, TelegramMethod
+from aiogram.types import CallbackQuery, TelegramObject
+
+from database.cache import TTLCache
+
+
+class MemoryThrottleStore:
+    """Счётчик запросов в скользящем окне: по два числа на ключ (текущее и прошлое окно), O(1) на запрос"""
+
+    def __init__(self, window: float, maxsize: int = 100_000):
+        self.window = window
+        self.maxsize = maxsize
+        # ключ -> [номер текущего окна, счётчик прошлого окна, счётчик текущего окна]
+        self._counters: "OrderedDict[str, list]" = OrderedDict()
+
+    async def hit(self, key: str) -> float:
+        """Учитывает запрос и возвращает оценку числа запросов за последние window секунд"""
+        now = time.monotonic()
+        window_index = math.floor(now / self.window)
+
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = [window_index, 0, 0]
+            if len(self._counters) > self.maxsize:
+                self._counters.popitem(last=False)
+        else:
+            self._counters.move_to_end(key)
+
+        if counter[0] != window_index:
+            counter[1] = counter[2] if counter[0] == window_index - 1 else 0
+            counter[2] = 0
+            counter[0] = window_index
+        counter[2] += 1
+
+        # Прошлое окно учитывается пропорционально тому, какая его часть ещё попадает в скользящее окно
+        elapsed = now / self.window - window_index
+        return counter[1] * (1 - elapsed) + counter[2]
+
+    async def close(self):
+        pass
+
+
+class RedisThrottleStore:
+    """Тот же скользящий счётчик в Redis — общий для нескольких процессов бота"""
+
+    def __init__(self, redis_url: str, window: float, prefix: str = "throttle"):
+        # redis — необязательная зависимость, нужна только для этого режима
+        from redis.asyncio import Redis
+
+        self.redis = Redis.from_url(redis_url)
+        self.window = window
+        self.prefix = prefix
+
+    async def hit(self, key: str) -> float:
+        now = time.time()
+        window_index = math.floor(now / self.window)
+        current_key = f"{self.prefix}:{key}:{window_index}"
+        previous_key = f"{self.prefix}:{key}:{window_index - 1}"
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.incr(current_key)
+            pipe.expire(current_key, math.ceil(self.window * 2))
+            pipe.get(previous_key)
+            current, _, previous = await pipe.execute()
+
+        elapsed = now / self.window - window_index
+        return int(previous or 0) * (1 - elapsed) + int(current)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_throttle_store(kind: str, window: float, redis_url: Optional[str] = None):
+    if kind == "memory":
+        return MemoryThrottleStore(window)
+    if kind == "redis":
+        return RedisThrottleStore(redis_url, window)
+    raise ValueError(f"Неизвестный тип хранилища для защиты от флуда: {kind}")
+
+
+# Ответ на нажатие, отклонённое защитой от флуда. Его не запоминают для повторных нажатий:
+# через окно THROTTLE_WINDOW то же нажатие должно снова дойти до хендлера
+THROTTLED_ANSWER = "⏳ Слишком часто, попробуйте чуть позже"
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Защита от флуда: ограничивает частоту запросов пользователя и чата"""
+
+    def __init__(self, store, user_limit: int, chat_limit: int = 0):
+        self.store = store
+        self.user_limit = user_limit
+        self.chat_limit = chat_limit
+
+    async def _is_flooding(self, data: Dict[str, Any]) -> bool:
+        user = data.get("event_from_user")
+        if user and self.user_limit and await self.store.hit(f"user:{user.id}") > self.user_limit:
+            return True
+        chat = data.get("event_chat")
+        if chat and self.chat_limit and await self.store.hit(f"chat:{chat.id}") > self.chat_limit:
+            return True
+        return False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if await self._is_flooding(data):
+            if isinstance(event, CallbackQuery):
+                await event.answer(THROTTLED_ANSWER)
+            return None
+        return await handler(event, data)
+
+
+class DuplicateCallbackMiddleware(BaseMiddleware):
+    """Повторное нажатие той же кнопки, пока не прошло ttl секунд, получает тот же ответ, что и первое,
+    без вызова хендлера. Подходит только для кнопок, повторное нажатие которых ничего не меняет"""
+
+    def __init__(self, ttl: float = 30):
+        self.answers = TTLCache(maxsize=10_000, ttl=ttl)
+        self.answer_recorder = CallbackAnswerRecorder(self)
+        # Нажатия, которые сейчас обрабатываются: id callback-запроса -> (пользователь, сообщение, данные кнопки)
+        self._in_flight: Dict[str, Hashable] = {}
+        self._in_flight_keys: Set[Hashable] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        # Кнопки анонсов разных мероприятий одинаковы (event:remind), поэтому в ключ входит и сообщение
+        message = event.message
+        key = (
+            event.from_user.id,
+            (message.chat.id, message.message_id) if message else event.inline_message_id,
+            event.data
+        )
+        cached = self.answers.get(key)
+        if cached is not None:
+            await event.answer(**cached)
+            return None
+        if key in self._in_flight_keys:
+            # Первое нажатие ещё обрабатывается — просто убираем часики на кнопке
+            await event.answer()
+            return None
+
+        self._in_flight[event.id] = key
+        self._in_flight_keys.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.pop(event.id, None)
+            self._in_flight_keys.discard(key)
+
+    def remember_answer(self, method: AnswerCallbackQuery):
+        key = self._in_flight.get(method.callback_query_id)
+        # Всплывающие окна в этом боте — сообщения об ошибках, их не повторяем, как и отказ из-за флуда
+        if key is not None and not method.show_alert and method.text != THROTTLED_ANSWER:
+            self.answers.set(key, {"text": method.text})
+
+
+class CallbackAnswerRecorder(BaseRequestMiddleware):
+    """Запоминает, что бот ответил на нажатие кнопки, чтобы отдать тот же ответ на повторное нажатие"""
+
+    def __init__(self, duplicates: DuplicateCallbackMiddleware):
+        self.duplicates = duplicates
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod
+    ):
+        response = await make_request(bot, method)
+        if isinstance(method, AnswerCallbackQuery):
+            self.duplicates.remember_answer(method)
+        return response
+
+
+def setup_throttling_middleware(
+    bot: Bot,
+    middleware: ThrottlingMiddleware,
+    *routers: Router,
+    duplicates: Optional[DuplicateCallbackMiddleware] = None,
+    idempotent_routers: Sequence[Router] = ()
+):
+    """Ограничение частоты — на всех routers. Повтор ответа — только на idempotent_routers: например, кнопки
+    листания /list при повторном нажатии должны снова вызывать хендлер"""
+    if duplicates is not None:
+        bot.session.middleware(duplicates.answer_recorder)
+        for router in idempotent_routers:
+            # Повтор регистрируется раньше ограничения частоты: повторные нажатия не расходуют лимит
+            router.callback_query.middleware(duplicates)
+    for router in routers:
+        router.message.middleware(middleware)
+        router.callback_query.middleware(middleware)
@@ -9,6 +9,100 @@ class Config:
     ADMIN_IDS = list(map(int, os.getenv("ADMIN_IDS", "").split(","))) if os.getenv("ADMIN_IDS") else []
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./bot.db")
 
+    # Режим вебхука: если WEBHOOK_URL задан, бот принимает обновления по HTTP вместо long polling
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+    WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+    WEBAPP_PORT = int(os.getenv("PORT", "8080"))
+
+    # Где хранится состояние диалога создания мероприятия: memory, database или redis (нужен пакет redis).
+    # Состояние читается на каждое обновление, в том числе на каждое нажатие кнопки, поэтому database и redis —
+    # это лишний запрос на обновление; они нужны, только если диалог должен пережить перезапуск.
+    # Незавершённые диалоги забываются через FSM_STATE_TTL секунд
+    FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+    FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "86400"))
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+    # Настройки соединений с базой. SQLite: режим журнала, synchronous, сколько миллисекунд ждать
+    # блокировку, размер кэша страниц и пула. PostgreSQL: размер пула, сверх пула и время жизни соединения
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+    SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+    # Метрики в формате Prometheus на WEBAPP_HOST:PORT по пути METRICS_PATH (в режиме вебхука — на том же сервере)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+    METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+
+    # Кэш мероприятий в памяти: сколько записей хранить и сколько секунд они актуальны
+    EVENT_CACHE_SIZE = int(os.getenv("EVENT_CACHE_SIZE", "256"))
+    EVENT_CACHE_TTL = float(os.getenv("EVENT_CACHE_TTL", "300"))
+
+    # Хранилище заданий планировщика: memory (пересоздаются при запуске) или database (таблица
+    # apscheduler_jobs в DATABASE_URL). Задание, опоздавшее не более чем на SCHEDULER_MISFIRE_GRACE
+    # секунд, всё равно выполнится; при SCHEDULER_COALESCE несколько пропущенных запусков сливаются в один
+    SCHEDULER_JOBSTORE = os.getenv("SCHEDULER_JOBSTORE", "memory")
+    SCHEDULER_MISFIRE_GRACE = int(os.getenv("SCHEDULER_MISFIRE_GRACE", "3600"))
+    SCHEDULER_COALESCE = os.getenv("SCHEDULER_COALESCE", "true").lower() in ("1", "true", "yes")
+
+    # Автоочистка: раз в CLEANUP_INTERVAL_HOURS часов удаляются мероприятия, прошедшие более
+    # EVENT_RETENTION_DAYS дней назад (0 часов — не запускать), по CLEANUP_BATCH_SIZE за транзакцию
+    CLEANUP_INTERVAL_HOURS = float(os.getenv("CLEANUP_INTERVAL_HOURS", "24"))
+    EVENT_RETENTION_DAYS = int(os.getenv("EVENT_RETENTION_DAYS", "30"))
+    CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "500"))
+
+    # За сколько до начала мероприятия приходят напоминания: через запятую, с единицами m, h или d.
+    # Раз в REMINDER_TICK_SECONDS секунд планировщик ставит в очередь все наступившие напоминания
+    REMINDER_OFFSETS = os.getenv("REMINDER_OFFSETS", "24h,3h")
+    # Свои смещения для отдельных чатов: "ID=48h,1h;ID=2h"
+    CHAT_REMINDER_OFFSETS = os.getenv("CHAT_REMINDER_OFFSETS", "")
+    REMINDER_TICK_SECONDS = float(os.getenv("REMINDER_TICK_SECONDS", "30"))
+
+    # Рассылка напоминаний: глобальный лимит (сообщений в секунду), лимит на один чат,
+    # число параллельных отправок и число повторов при временных ошибках
+    REMINDER_RATE_LIMIT = float(os.getenv("REMINDER_RATE_LIMIT", "30"))
+    REMINDER_PER_CHAT_RATE = float(os.getenv("REMINDER_PER_CHAT_RATE", "1"))
+    REMINDER_CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", "20"))
+    REMINDER_MAX_RETRIES = int(os.getenv("REMINDER_MAX_RETRIES", "3"))
+    # Сводка: если у участника в ближайшие REMINDER_DIGEST_WINDOW_MINUTES минут есть ещё напоминания,
+    # они приходят одним сообщением вместе с текущим (0 — каждое напоминание отдельным сообщением)
+    REMINDER_DIGEST_WINDOW_MINUTES = float(os.getenv("REMINDER_DIGEST_WINDOW_MINUTES", "0"))
+    # Сколько процессов рассылают напоминания (0 — в процессе бота). Лимит REMINDER_RATE_LIMIT у них общий
+    DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "0"))
+    # Сколько строк очереди напоминаний разбирать за один проход
+    REMINDER_OUTBOX_BATCH = int(os.getenv("REMINDER_OUTBOX_BATCH", "500"))
+    # Через сколько отправленных сообщений отмечать строки очереди как отправленные. Если процесс упадёт
+    # посреди рассылки, после перезапуска повторно уйдут только ещё не отмеченные сообщения
+    REMINDER_MARK_EVERY = int(os.getenv("REMINDER_MARK_EVERY", "50"))
+
+    # Логи: уровень и формат (text или json — по записи JSON на строку с полями event_id, reminder_type,
+    # user_id, duration). Об ошибках рассылки пишется сводка по причинам и не больше LOG_FAILURE_SAMPLES
+    # записей о конкретных пользователях
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    LOG_FAILURE_SAMPLES = int(os.getenv("LOG_FAILURE_SAMPLES", "5"))
+
+    # Сколько миллисекунд копить отклики на кнопку, чтобы записать их одной транзакцией (0 — писать сразу)
+    PARTICIPANT_WRITE_BATCH_MS = float(os.getenv("PARTICIPANT_WRITE_BATCH_MS", "10"))
+
+    # Защита от флуда: не больше THROTTLE_USER_LIMIT запросов пользователя и THROTTLE_CHAT_LIMIT запросов
+    # из одного чата за THROTTLE_WINDOW секунд (0 — без ограничения). Повторное нажатие «🔔 Напомнить»
+    # в течение THROTTLE_DUPLICATE_TTL секунд получает прежний ответ без обращения к базе
+    THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "true").lower() in ("1", "true", "yes")
+    THROTTLE_STORAGE = os.getenv("THROTTLE_STORAGE", "memory")
+    THROTTLE_WINDOW = float(os.getenv("THROTTLE_WINDOW", "5"))
+    THROTTLE_USER_LIMIT = int(os.getenv("THROTTLE_USER_LIMIT", "5"))
+    THROTTLE_CHAT_LIMIT = int(os.getenv("THROTTLE_CHAT_LIMIT", "0"))
+    THROTTLE_DUPLICATE_TTL = float(os.getenv("THROTTLE_DUPLICATE_TTL", "30"))
+
+    # Как часто (в секундах) можно обновлять счётчик на кнопке одного анонса
+    KEYBOARD_UPDATE_INTERVAL = float(os.getenv("KEYBOARD_UPDATE_INTERVAL", "3"))
+
     # Чаты сообществ в формате "Название:ID,Название:ID"
     COMMUNITY_CHATS = {}
     _chats_env = os.getenv("COMMUNITY_CHATS", "")
@@ -1,3 +1,7 @@
-from .models import Database, Event, Participant
+from .engine import EngineProfile
+from .models import Database, Event, Participant, ReminderOutbox, ReminderRule, UndeliverableUser, FsmRecord
 
-__all__ = ["Database", "Event", "Participant"]
+__all__ = [
+    "Database", "EngineProfile", "Event", "Participant", "ReminderOutbox", "ReminderRule",
+    "UndeliverableUser", "FsmRecord"
+]
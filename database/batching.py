@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer:
+    """Копит записи delay секунд (или до max_size штук) и сохраняет их одной транзакцией.
+    submit() возвращает управление только после коммита пачки, в которую попала запись"""
+
+    def __init__(
+        self,
+        flush: Callable[[List[Any]], Awaitable[None]],
+        delay: float,
+        max_size: int = 500
+    ):
+        self.flush = flush
+        self.delay = delay
+        self.max_size = max_size
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.delay, self._start_flush)
+
+        await future
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._write(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            await self.flush([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                _resolve(batch[0][1], e)
+                return
+            # Одна плохая запись (например, на удалённое мероприятие) не должна ронять всю пачку
+            logger.warning(f"Не удалось сохранить пачку из {len(batch)} записей, сохраняем по одной: {type(e).__name__}")
+            for item, future in batch:
+                try:
+                    await self.flush([item])
+                except Exception as item_error:
+                    _resolve(future, item_error)
+                else:
+                    _resolve(future)
+            return
+
+        for _, future in batch:
+            _resolve(future)
+
+    async def close(self):
+        self._start_flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def _resolve(future: asyncio.Future, error: Optional[Exception] = None):
+    # Вызывающий мог уже отменить ожидание
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
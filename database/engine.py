@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+@dataclass
+class EngineProfile:
+    # SQLite: PRAGMA, выполняемые на каждом новом соединении
+    sqlite_pragmas: bool = True
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    busy_timeout_ms: int = 5000
+    cache_size_kb: int = 20000
+    foreign_keys: bool = True
+    # aiosqlite по умолчанию открывает новое соединение на каждую сессию (NullPool);
+    # небольшой пул убирает эти затраты и ограничивает число конкурирующих писателей
+    sqlite_pool_size: int = 5
+    # PostgreSQL и другие серверные СУБД: параметры пула соединений
+    pool_size: int = 10
+    max_overflow: int = 20
+    pool_recycle: int = 1800
+
+
+def create_engine(db_url: str, profile: EngineProfile) -> AsyncEngine:
+    url = make_url(db_url)
+
+    if url.get_backend_name() != "sqlite":
+        return create_async_engine(
+            db_url,
+            echo=False,
+            pool_size=profile.pool_size,
+            max_overflow=profile.max_overflow,
+            pool_recycle=profile.pool_recycle,
+            pool_pre_ping=True
+        )
+
+    if not profile.sqlite_pragmas:
+        return create_async_engine(db_url, echo=False)
+
+    if url.database and url.database != ":memory:":
+        engine = create_async_engine(
+            db_url,
+            echo=False,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=profile.sqlite_pool_size,
+            max_overflow=0
+        )
+    else:
+        engine = create_async_engine(db_url, echo=False)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL позволяет читать во время записи, synchronous=NORMAL в режиме WAL не делает fsync на каждый commit,
+        # busy_timeout заставляет писателей ждать блокировку вместо ошибки "database is locked"
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={profile.journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={profile.synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={profile.busy_timeout_ms}")
+        cursor.execute(f"PRAGMA cache_size=-{profile.cache_size_kb}")
+        cursor.execute(f"PRAGMA foreign_keys={'ON' if profile.foreign_keys else 'OFF'}")
+        cursor.close()
+
+    return engine
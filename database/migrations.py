@@ -0,0 +1,45 @@
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+logger = logging.getLogger(__name__)
+
+# Миграции схемы: (версия, SQL-команды). Новые базы создаются через create_all уже в актуальном виде,
+# поэтому команды должны быть идемпотентными (IF NOT EXISTS и т.п.).
+MIGRATIONS: List[Tuple[int, List[str]]] = [
+    (1, [
+        # Уникальный индекс участников: сначала убираем накопившиеся дубли
+        "DELETE FROM participants WHERE id NOT IN "
+        "(SELECT MIN(id) FROM participants GROUP BY event_id, user_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_participants_event_user ON participants (event_id, user_id)",
+    ]),
+    (2, [
+        "CREATE INDEX IF NOT EXISTS ix_events_date_time ON events (date_time)",
+    ]),
+    (3, [
+        "CREATE INDEX IF NOT EXISTS ix_events_chat_message ON events (chat_id, message_id)",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(conn: AsyncConnection) -> int:
+    await conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    result = await conn.execute(text("SELECT MAX(version) FROM schema_version"))
+    return result.scalar() or 0
+
+
+async def apply_migrations(conn: AsyncConnection):
+    current_version = await get_schema_version(conn)
+
+    for version, statements in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        logger.info(f"Применение миграции схемы базы данных до версии {version}")
+        for statement in statements:
+            await conn.execute(text(statement))
+        await conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
@@ -1,8 +1,18 @@
+import asyncio
 from datetime import datetime
-from typing import Optional, List
-from sqlalchemy import BigInteger, String, DateTime, ForeignKey, select, delete
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine, AsyncSession
+from typing import Dict, Optional, List, Tuple
+from sqlalchemy import (
+    BigInteger, String, Text, DateTime, ForeignKey, Index, UniqueConstraint,
+    select, delete, update, exists, literal, func, case
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, selectinload, aliased
+from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, AsyncSession
+
+from .batching import WriteBuffer
+from .cache import TTLCache
+from .engine import EngineProfile, create_engine
+from .migrations import apply_migrations
 
 
 class Base(AsyncAttrs, DeclarativeBase):
@@ -11,11 +21,15 @@ class Base(AsyncAttrs, DeclarativeBase):
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (
+        # Поиск мероприятия по сообщению с анонсом
+        Index("ix_events_chat_message", "chat_id", "message_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     event_number: Mapped[int] = mapped_column()
     title: Mapped[str] = mapped_column(String(255))
-    date_time: Mapped[datetime] = mapped_column(DateTime)
+    date_time: Mapped[datetime] = mapped_column(DateTime, index=True)
     end_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     address: Mapped[str] = mapped_column(String(500))
     description: Mapped[str] = mapped_column(String(2000))
@@ -26,10 +40,17 @@ class Event(Base):
         back_populates="event",
         cascade="all, delete-orphan"
     )
+    reminder_rules: Mapped[List["ReminderRule"]] = relationship(
+        back_populates="event",
+        cascade="all, delete-orphan"
+    )
 
 
 class Participant(Base):
     __tablename__ = "participants"
+    __table_args__ = (
+        Index("uq_participants_event_user", "event_id", "user_id", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     event_id: Mapped[int] = mapped_column(ForeignKey("events.id", ondelete="CASCADE"))
@@ -41,18 +62,109 @@ class Participant(Base):
     event: Mapped["Event"] = relationship(back_populates="participants")
 
 
+class ReminderOutbox(Base):
+    __tablename__ = "reminder_outbox"
+    __table_args__ = (
+        UniqueConstraint("event_id", "user_id", "reminder_type", name="uq_reminder_outbox_event_user_type"),
+    )
+
+    STATUS_PENDING = "pending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUS_EXPIRED = "expired"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    event_id: Mapped[int] = mapped_column(ForeignKey("events.id", ondelete="CASCADE"))
+    user_id: Mapped[int] = mapped_column(BigInteger)
+    reminder_type: Mapped[str] = mapped_column(String(20))
+    status: Mapped[str] = mapped_column(String(20), default=STATUS_PENDING, index=True)
+    attempts: Mapped[int] = mapped_column(default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class ReminderRule(Base):
+    """Напоминание мероприятия: когда отправить и готовый текст (шаблон подставляется один раз при создании)"""
+    __tablename__ = "reminder_rules"
+    __table_args__ = (
+        UniqueConstraint("event_id", "reminder_type", name="uq_reminder_rules_event_type"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    event_id: Mapped[int] = mapped_column(ForeignKey("events.id", ondelete="CASCADE"))
+    reminder_type: Mapped[str] = mapped_column(String(20))
+    offset_minutes: Mapped[int] = mapped_column()
+    text: Mapped[str] = mapped_column(Text)
+    fire_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+    dispatched_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    event: Mapped["Event"] = relationship(back_populates="reminder_rules")
+
+
+class UndeliverableUser(Base):
+    """Пользователь, которому бот не может писать: не запускал бота или заблокировал его.
+    Запись удаляется, когда пользователь отправляет /start"""
+    __tablename__ = "undeliverable_users"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    reason: Mapped[str] = mapped_column(String(255))
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class FsmRecord(Base):
+    __tablename__ = "fsm_states"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    data: Mapped[str] = mapped_column(Text, default="{}")
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, index=True)
+
+
+# Значения state и data у строки без состояния
+FSM_RECORD_DEFAULTS = {"state": None, "data": "{}"}
+
+
 class Database:
-    def __init__(self, db_url: str = "sqlite+aiosqlite:///./bot.db"):
-        self.engine = create_async_engine(db_url, echo=False)
+    def __init__(
+        self,
+        db_url: str = "sqlite+aiosqlite:///./bot.db",
+        cache_size: int = 256,
+        cache_ttl: float = 300,
+        engine_profile: Optional[EngineProfile] = None,
+        participant_batch_ms: float = 0
+    ):
+        self.engine = create_engine(db_url, engine_profile or EngineProfile())
         self.session_maker = async_sessionmaker(
             self.engine,
             class_=AsyncSession,
             expire_on_commit=False
         )
+        # Мероприятий немного и меняются они редко — держим их в памяти
+        self.event_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # Отклики, пришедшие за participant_batch_ms миллисекунд, пишутся одной транзакцией
+        self.participant_buffer = (
+            WriteBuffer(self._write_participants, delay=participant_batch_ms / 1000)
+            if participant_batch_ms > 0 else None
+        )
 
     async def init_db(self):
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            # create_all не меняет существующие таблицы — индексы для старых баз добавляют миграции
+            await apply_migrations(conn)
+
+    async def close(self):
+        if self.participant_buffer is not None:
+            await self.participant_buffer.close()
+        await self.engine.dispose()
+
+    def _upsert_insert(self):
+        # INSERT ... ON CONFLICT есть только у SQLite и PostgreSQL
+        dialect = self.engine.dialect.name
+        if dialect == "sqlite":
+            return sqlite.insert
+        if dialect == "postgresql":
+            return postgresql.insert
+        return None
 
     async def get_session(self) -> AsyncSession:
         async with self.session_maker() as session:
@@ -67,7 +179,8 @@ class Database:
         address: str,
         description: str,
         message_id: Optional[int] = None,
-        chat_id: Optional[int] = None
+        chat_id: Optional[int] = None,
+        reminder_rules: Optional[List["ReminderRule"]] = None
     ) -> Event:
         async with self.session_maker() as session:
             event = Event(
@@ -78,38 +191,131 @@ class Database:
                 address=address,
                 description=description,
                 message_id=message_id,
-                chat_id=chat_id
+                chat_id=chat_id,
+                reminder_rules=reminder_rules or []
             )
             session.add(event)
             await session.commit()
             await session.refresh(event)
+            # refresh сбрасывает связи; правила нужны вместе с мероприятием в кэше (текст подтверждения отклика)
+            await event.awaitable_attrs.reminder_rules
+
+        self.event_cache.set(event.id, event)
+        if event.message_id is not None:
+            # Первые нажатия на кнопку приходят сразу после публикации
+            self.event_cache.set(("message", event.chat_id, event.message_id), event)
+        return event
+
+    async def get_event_by_message(self, chat_id: int, message_id: int) -> Optional[Event]:
+        key = ("message", chat_id, message_id)
+        event = self.event_cache.get(key)
+        if event is not None:
             return event
 
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(Event)
+                .where(Event.chat_id == chat_id, Event.message_id == message_id)
+                .options(selectinload(Event.reminder_rules))
+            )
+            event = result.scalars().first()
+
+        if event is not None:
+            self.event_cache.set(key, event)
+        return event
+
     async def get_event(self, event_id: int) -> Optional[Event]:
+        event = self.event_cache.get(event_id)
+        if event is not None:
+            return event
+
         async with self.session_maker() as session:
             result = await session.execute(
-                select(Event).where(Event.id == event_id)
+                select(Event).where(Event.id == event_id).options(selectinload(Event.reminder_rules))
             )
-            return result.scalar_one_or_none()
+            event = result.scalar_one_or_none()
+
+        if event is not None:
+            self.event_cache.set(event_id, event)
+        return event
 
     async def get_all_events(self) -> List[Event]:
         async with self.session_maker() as session:
             result = await session.execute(select(Event))
             return list(result.scalars().all())
 
-    async def get_upcoming_events(self) -> List[Event]:
+    async def next_event_number(self) -> int:
+        async with self.session_maker() as session:
+            result = await session.execute(select(func.max(Event.event_number)))
+            return (result.scalar() or 0) + 1
+
+    async def get_upcoming_events_with_participants(self) -> List[Event]:
+        # Участники всех мероприятий подгружаются одним дополнительным запросом, а не по запросу на мероприятие
         async with self.session_maker() as session:
             result = await session.execute(
-                select(Event).where(Event.date_time > datetime.now())
+                select(Event)
+                .where(Event.date_time > datetime.now())
+                .order_by(Event.date_time)
+                .options(selectinload(Event.participants))
             )
             return list(result.scalars().all())
 
-    async def delete_old_events(self):
-        async with self.session_maker() as session:
-            await session.execute(
-                delete(Event).where(Event.date_time < datetime.now())
-            )
-            await session.commit()
+    async def delete_old_events(
+        self,
+        before: Optional[datetime] = None,
+        batch_size: int = 500
+    ) -> Tuple[int, int]:
+        """Удаляет прошедшие мероприятия вместе с участниками небольшими транзакциями.
+        Возвращает число удалённых мероприятий и участников."""
+        if before is None:
+            before = datetime.now()
+
+        deleted_events = 0
+        deleted_participants = 0
+
+        while True:
+            async with self.session_maker() as session:
+                result = await session.execute(
+                    select(Event.id).where(Event.date_time < before).limit(batch_size)
+                )
+                event_ids = list(result.scalars().all())
+                if not event_ids:
+                    break
+
+                # SQLite без PRAGMA foreign_keys не выполняет ON DELETE CASCADE — удаляем зависимые строки явно
+                result = await session.execute(delete(Participant).where(Participant.event_id.in_(event_ids)))
+                deleted_participants += result.rowcount
+                await session.execute(delete(ReminderOutbox).where(ReminderOutbox.event_id.in_(event_ids)))
+                await session.execute(delete(ReminderRule).where(ReminderRule.event_id.in_(event_ids)))
+                result = await session.execute(delete(Event).where(Event.id.in_(event_ids)))
+                deleted_events += result.rowcount
+                await session.commit()
+
+            # Отдаём управление циклу событий между пачками, чтобы бот продолжал отвечать
+            await asyncio.sleep(0)
+
+        # Участники, оставшиеся от мероприятий, удалённых раньше без каскада
+        for model in (Participant, ReminderOutbox, ReminderRule):
+            while True:
+                async with self.session_maker() as session:
+                    result = await session.execute(
+                        select(model.id)
+                        .where(~exists().where(Event.id == model.event_id))
+                        .limit(batch_size)
+                    )
+                    orphan_ids = list(result.scalars().all())
+                    if not orphan_ids:
+                        break
+
+                    result = await session.execute(delete(model).where(model.id.in_(orphan_ids)))
+                    if model is Participant:
+                        deleted_participants += result.rowcount
+                    await session.commit()
+
+                await asyncio.sleep(0)
+
+        self.event_cache.clear()
+        return deleted_events, deleted_participants
 
     async def add_participant(
         self,
@@ -117,34 +323,287 @@ class Database:
         user_id: int,
         username: Optional[str],
         fullname: str
-    ) -> Participant:
+    ):
+        row = dict(
+            event_id=event_id,
+            user_id=user_id,
+            username=username,
+            fullname=fullname,
+            timestamp=datetime.now()
+        )
+        if self.participant_buffer is not None:
+            await self.participant_buffer.submit(row)
+        else:
+            await self._write_participants([row])
+
+    async def _write_participants(self, rows: List[dict]):
+        # Повторные нажатия одного пользователя в пачке схлопываются: PostgreSQL не даёт
+        # ON CONFLICT DO UPDATE изменить одну строку дважды в одной команде
+        rows = list({(row["event_id"], row["user_id"]): row for row in rows}.values())
+
+        insert = self._upsert_insert()
+        async with self.session_maker() as session:
+            if insert is None:
+                for row in rows:
+                    result = await session.execute(
+                        select(Participant).where(
+                            Participant.event_id == row["event_id"],
+                            Participant.user_id == row["user_id"]
+                        )
+                    )
+                    participant = result.scalar_one_or_none()
+                    if participant:
+                        participant.timestamp = row["timestamp"]
+                    else:
+                        session.add(Participant(**row))
+            else:
+                statement = insert(Participant).values(rows)
+                await session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=[Participant.event_id, Participant.user_id],
+                        set_={"timestamp": statement.excluded.timestamp}
+                    )
+                )
+
+            await session.commit()
+
+    async def get_participants_by_event(self, event_id: int) -> List[Participant]:
         async with self.session_maker() as session:
             result = await session.execute(
-                select(Participant).where(
-                    Participant.event_id == event_id,
-                    Participant.user_id == user_id
+                select(Participant).where(Participant.event_id == event_id)
+            )
+            return list(result.scalars().all())
+
+    async def get_participants_page(self, event_id: int, offset: int, limit: int) -> List[Participant]:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(Participant)
+                .where(Participant.event_id == event_id)
+                .order_by(Participant.id)
+                .offset(offset)
+                .limit(limit)
+            )
+            return list(result.scalars().all())
+
+    async def count_participants(self, event_id: int) -> int:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(func.count()).select_from(Participant).where(Participant.event_id == event_id)
+            )
+            return result.scalar_one()
+
+    @staticmethod
+    def _enqueue_statement(reminder_type: str, *conditions):
+        """INSERT ... SELECT строк очереди для участников, подходящих под условия, которым это напоминание
+        ещё не ставилось. Пользователи, которым бот не может писать, пропускаются"""
+        already_queued = exists().where(
+            ReminderOutbox.event_id == Participant.event_id,
+            ReminderOutbox.user_id == Participant.user_id,
+            ReminderOutbox.reminder_type == reminder_type
+        )
+        return ReminderOutbox.__table__.insert().from_select(
+            ["event_id", "user_id", "reminder_type", "status", "attempts", "updated_at"],
+            select(
+                Participant.event_id,
+                Participant.user_id,
+                literal(reminder_type),
+                literal(ReminderOutbox.STATUS_PENDING),
+                literal(0),
+                literal(datetime.now(), DateTime)
+            ).where(
+                ~already_queued,
+                ~exists().where(UndeliverableUser.user_id == Participant.user_id),
+                *conditions
+            )
+        )
+
+    async def enqueue_reminders(
+        self,
+        event_id: int,
+        reminder_type: str,
+        only_participants_of: Optional[List[int]] = None
+    ) -> int:
+        """Кладёт в очередь по строке на каждого участника, которому это напоминание ещё не ставилось.
+        only_participants_of ограничивает очередь теми, кто записан и на одно из указанных мероприятий"""
+        conditions = [Participant.event_id == event_id]
+        if only_participants_of is not None:
+            other = aliased(Participant)
+            conditions.append(Participant.user_id.in_(
+                select(other.user_id).where(other.event_id.in_(only_participants_of))
+            ))
+        async with self.session_maker() as session:
+            result = await session.execute(self._enqueue_statement(reminder_type, *conditions))
+            await session.commit()
+            return result.rowcount
+
+    async def enqueue_rule_reminders(self, rules: List[ReminderRule]) -> int:
+        """Ставит в очередь напоминания по правилам и помечает правила отработанными — одной транзакцией"""
+        queued = 0
+        async with self.session_maker() as session:
+            for rule in rules:
+                result = await session.execute(
+                    self._enqueue_statement(rule.reminder_type, Participant.event_id == rule.event_id)
                 )
+                queued += result.rowcount
+            await session.execute(
+                update(ReminderRule)
+                .where(ReminderRule.id.in_([rule.id for rule in rules]))
+                .values(dispatched_at=datetime.now())
             )
-            participant = result.scalar_one_or_none()
+            await session.commit()
+        return queued
 
-            if participant:
-                participant.timestamp = datetime.now()
-            else:
-                participant = Participant(
-                    event_id=event_id,
-                    user_id=user_id,
-                    username=username,
-                    fullname=fullname
+    async def get_reminder_rules_between(self, start: datetime, end: datetime) -> List[ReminderRule]:
+        """Ещё не отработанные правила, время которых попадает в [start, end]"""
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(ReminderRule)
+                .where(
+                    ReminderRule.fire_at >= start,
+                    ReminderRule.fire_at <= end,
+                    ReminderRule.dispatched_at.is_(None)
+                )
+                .order_by(ReminderRule.fire_at)
+            )
+            return list(result.scalars().all())
+
+    async def get_reminder_rule(self, event_id: int, reminder_type: str) -> Optional[ReminderRule]:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(ReminderRule).where(
+                    ReminderRule.event_id == event_id,
+                    ReminderRule.reminder_type == reminder_type
                 )
-                session.add(participant)
+            )
+            return result.scalar_one_or_none()
+
+    async def get_events_without_reminder_rules(self) -> List[Event]:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(Event).where(
+                    Event.date_time > datetime.now(),
+                    ~exists().where(ReminderRule.event_id == Event.id)
+                )
+            )
+            return list(result.scalars().all())
 
+    async def add_reminder_rules(self, rules: List[ReminderRule]):
+        async with self.session_maker() as session:
+            session.add_all(rules)
             await session.commit()
-            await session.refresh(participant)
-            return participant
+        # Мероприятия в кэше загружены вместе с правилами напоминаний
+        self.event_cache.clear()
 
-    async def get_participants_by_event(self, event_id: int) -> List[Participant]:
+    async def get_pending_reminders(self, limit: int) -> List[ReminderOutbox]:
+        # Строки разных напоминаний берутся по очереди: напоминание, наступившее во время большой рассылки,
+        # попадает уже в следующую пачку, а не ждёт, пока разойдутся все строки, поставленные раньше
+        rank = func.row_number().over(
+            partition_by=(ReminderOutbox.event_id, ReminderOutbox.reminder_type),
+            order_by=ReminderOutbox.id
+        ).label("rank")
+        ranked = (
+            select(ReminderOutbox.id, rank)
+            .where(ReminderOutbox.status == ReminderOutbox.STATUS_PENDING)
+            .subquery()
+        )
         async with self.session_maker() as session:
             result = await session.execute(
-                select(Participant).where(Participant.event_id == event_id)
+                select(ReminderOutbox)
+                .join(ranked, ReminderOutbox.id == ranked.c.id)
+                .order_by(ranked.c.rank, ReminderOutbox.id)
+                .limit(limit)
             )
             return list(result.scalars().all())
+
+    async def mark_reminders(self, ids: List[int], status: str):
+        if not ids:
+            return
+        async with self.session_maker() as session:
+            await session.execute(
+                update(ReminderOutbox)
+                .where(ReminderOutbox.id.in_(ids))
+                .values(
+                    status=status,
+                    attempts=ReminderOutbox.attempts + 1,
+                    updated_at=datetime.now()
+                )
+            )
+            await session.commit()
+
+    async def mark_undeliverable(self, reasons: Dict[int, str]):
+        """Запоминает пользователей, которым не удалось написать: {user_id: причина}"""
+        if not reasons:
+            return
+        insert = self._upsert_insert()
+        async with self.session_maker() as session:
+            if insert is None:
+                for user_id, reason in reasons.items():
+                    await session.merge(UndeliverableUser(user_id=user_id, reason=reason[:255], updated_at=datetime.now()))
+            else:
+                statement = insert(UndeliverableUser).values([
+                    {"user_id": user_id, "reason": reason[:255], "updated_at": datetime.now()}
+                    for user_id, reason in reasons.items()
+                ])
+                await session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=[UndeliverableUser.user_id],
+                        set_={"reason": statement.excluded.reason, "updated_at": statement.excluded.updated_at}
+                    )
+                )
+            await session.commit()
+
+    async def clear_undeliverable(self, user_id: int):
+        async with self.session_maker() as session:
+            await session.execute(delete(UndeliverableUser).where(UndeliverableUser.user_id == user_id))
+            await session.commit()
+
+    async def is_deliverable(self, user_id: int) -> bool:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(UndeliverableUser.user_id).where(UndeliverableUser.user_id == user_id)
+            )
+            return result.scalar_one_or_none() is None
+
+    async def get_fsm_record(self, key: str, updated_after: datetime) -> Optional[FsmRecord]:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(FsmRecord).where(FsmRecord.key == key, FsmRecord.updated_at > updated_after)
+            )
+            return result.scalar_one_or_none()
+
+    async def save_fsm_record(self, key: str, expired_before: datetime, **values):
+        """Состояние и данные хранятся в одной строке. Если строка устарела, поля, которые не переданы,
+        сбрасываются — иначе запись данных вернула бы к жизни состояние брошенного диалога"""
+        values["updated_at"] = datetime.now()
+        reset = {name: value for name, value in FSM_RECORD_DEFAULTS.items() if name not in values}
+        insert = self._upsert_insert()
+        async with self.session_maker() as session:
+            if insert is None:
+                record = await session.get(FsmRecord, key)
+                if record is None:
+                    session.add(FsmRecord(key=key, **values))
+                else:
+                    if record.updated_at <= expired_before:
+                        values.update(reset)
+                    for name, value in values.items():
+                        setattr(record, name, value)
+            else:
+                # В SET ... ON CONFLICT столбцы строки — значения до обновления, в том числе updated_at
+                set_ = dict(values)
+                for name, value in reset.items():
+                    column = getattr(FsmRecord, name)
+                    set_[name] = case((FsmRecord.updated_at <= expired_before, value), else_=column)
+                await session.execute(
+                    insert(FsmRecord)
+                    .values(key=key, **values)
+                    .on_conflict_do_update(index_elements=[FsmRecord.key], set_=set_)
+                )
+            await session.commit()
+
+    async def delete_expired_fsm_records(self, updated_before: datetime) -> int:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                delete(FsmRecord).where(FsmRecord.updated_at <= updated_before)
+            )
+            await session.commit()
+            return result.rowcount
@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.util
+import random
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+)
+
+from metrics import REMINDER_DELIVERY_LATENCY, REMINDERS_FAILED, REMINDERS_RETRIED, REMINDERS_SENT
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых имеет смысл повторить отправку
+TRANSIENT_ERRORS = (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)
+
+# Вызывается по мере рассылки для каждого получателя: ошибка или None, если сообщение доставлено
+ResultCallback = Callable[[int, Optional[Exception]], None]
+
+
+def is_undeliverable(error: Exception) -> bool:
+    """Пользователь заблокировал бота, не запускал его или удалён — повторять отправку бессмысленно"""
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    if isinstance(error, TelegramBadRequest):
+        return "chat not found" in str(error).lower()
+    if isinstance(error, DeliveryError):
+        return error.kind == TelegramForbiddenError.__name__ or (
+            error.kind == TelegramBadRequest.__name__ and "chat not found" in error.message.lower()
+        )
+    return False
+
+
+class TokenBucket:
+    """Асинхронный token bucket: не более rate операций в секунду с запасом capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds: float):
+        # Telegram просит подождать — останавливаем выдачу токенов для всех отправителей
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SharedTokenBucket:
+    """Тот же token bucket, но общий для нескольких процессов: состояние лежит в разделяемой памяти.
+    Передаётся в процессы при их запуске (initargs пула), а не с каждой задачей"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, context=multiprocessing):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        # [токены, время пополнения, пауза до]; time.monotonic() общий для процессов одной машины
+        self._state = context.Array("d", [self.capacity, time.monotonic(), 0.0])
+
+    def pause(self, seconds: float):
+        # Пауза, которую попросил Telegram у одного процесса, останавливает и остальные
+        with self._state.get_lock():
+            self._state[2] = max(self._state[2], time.monotonic() + seconds)
+
+    def _try_acquire(self) -> float:
+        """Берёт токен и возвращает 0 или сколько секунд подождать перед следующей попыткой"""
+        with self._state.get_lock():
+            now = time.monotonic()
+            if now < self._state[2]:
+                return self._state[2] - now
+
+            self._state[0] = min(self.capacity, self._state[0] + (now - self._state[1]) * self.rate)
+            self._state[1] = now
+            if self._state[0] >= 1:
+                self._state[0] -= 1
+                return 0.0
+            return (1 - self._state[0]) / self.rate
+
+    async def acquire(self):
+        while True:
+            delay = self._try_acquire()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class FanOutStats:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    duration: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    errors: Dict[int, Exception] = field(default_factory=dict)
+    delivered: List[int] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.duration if self.duration else 0.0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def merge(self, other: "FanOutStats"):
+        """Добавляет результаты другой рассылки; длительность не складывается, её задаёт вызывающий"""
+        self.sent += other.sent
+        self.failed += other.failed
+        self.retried += other.retried
+        self.latencies.extend(other.latencies)
+        self.errors.update(other.errors)
+        self.delivered.extend(other.delivered)
+
+    def summary(self) -> str:
+        return (
+            f"отправлено: {self.sent}, не удалось отправить: {self.failed}, повторов: {self.retried}, "
+            f"за {self.duration:.2f} с ({self.throughput:.1f} сообщ./с), "
+            f"задержка p50={self.percentile(50) * 1000:.0f} мс, "
+            f"p90={self.percentile(90) * 1000:.0f} мс, p99={self.percentile(99) * 1000:.0f} мс"
+        )
+
+
+class FanOutSender:
+    """Параллельная рассылка сообщений с учётом лимитов Telegram"""
+
+    def __init__(
+        self,
+        bot,
+        global_rate: float = 30,
+        per_chat_rate: float = 1,
+        concurrency: int = 20,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        global_bucket: Optional[SharedTokenBucket] = None
+    ):
+        self.bot = bot
+        # Общий лимит может быть разделён с другими процессами-рассыльщиками
+        self.global_bucket = global_bucket or TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _backoff(self, attempt: int) -> float:
+        # Экспоненциальная задержка с "полным" джиттером
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _send_one(
+        self,
+        chat_id: int,
+        text: str,
+        chat_bucket: TokenBucket,
+        stats: FanOutStats,
+        on_result: Optional[ResultCallback] = None
+    ):
+        started = time.monotonic()
+        attempt = 0
+
+        while True:
+            await chat_bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+                latency = time.monotonic() - started
+                stats.sent += 1
+                stats.delivered.append(chat_id)
+                stats.latencies.append(latency)
+                REMINDERS_SENT.inc()
+                REMINDER_DELIVERY_LATENCY.observe(latency)
+                if on_result:
+                    on_result(chat_id, None)
+                return
+            except TelegramRetryAfter as e:
+                self.global_bucket.pause(e.retry_after)
+                error = e
+                delay = e.retry_after
+            except TRANSIENT_ERRORS as e:
+                error = e
+                delay = self._backoff(attempt)
+            except Exception as e:
+                self._fail(chat_id, e, stats, on_result)
+                return
+
+            if attempt >= self.max_retries:
+                self._fail(chat_id, error, stats, on_result)
+                return
+
+            attempt += 1
+            stats.retried += 1
+            REMINDERS_RETRIED.inc()
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _fail(chat_id: int, error: Exception, stats: FanOutStats, on_result: Optional[ResultCallback]):
+        stats.failed += 1
+        stats.errors[chat_id] = error
+        REMINDERS_FAILED.inc()
+        if on_result:
+            on_result(chat_id, error)
+
+    async def send_many(
+        self,
+        messages: Iterable[Tuple[int, str]],
+        on_result: Optional[ResultCallback] = None
+    ) -> FanOutStats:
+        stats = FanOutStats()
+        queue: asyncio.Queue = asyncio.Queue()
+        for chat_id, text in messages:
+            queue.put_nowait((chat_id, text))
+
+        chat_buckets: Dict[int, TokenBucket] = {}
+
+        async def worker():
+            while True:
+                try:
+                    chat_id, text = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                bucket = chat_buckets.get(chat_id)
+                if bucket is None:
+                    bucket = chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=1)
+                await self._send_one(chat_id, text, bucket, stats, on_result)
+
+        started = time.monotonic()
+        workers = min(self.concurrency, queue.qsize())
+        if workers:
+            await asyncio.gather(*(worker() for _ in range(workers)))
+        stats.duration = time.monotonic() - started
+        return stats
+
+
+class DeliveryError(Exception):
+    """Ошибка отправки из процесса-рассыльщика: исключения aiogram не переносятся между процессами"""
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(kind, message)
+        self.kind = kind
+        self.message = message
+
+    def __str__(self) -> str:
+        return self.message
+
+
+def _warm_up():
+    # Импорт этого модуля (и aiogram) и инициализация процесса-рассыльщика происходят при его запуске
+    return None
+
+
+# Состояние процесса-рассыльщика: свой цикл событий, бот и отправитель живут между пачками, чтобы не
+# открывать заново соединения с Telegram и не начинать каждую пачку с полным запасом токенов
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+_worker_bot: Optional[Bot] = None
+_worker_sender: Optional[FanOutSender] = None
+
+
+def _close_worker_bot():
+    _worker_loop.run_until_complete(_worker_bot.session.close())
+
+
+def _init_worker(token: str, api: TelegramAPIServer, global_bucket: SharedTokenBucket, sender_options: dict):
+    """Инициализатор процесса-рассыльщика в пуле"""
+    global _worker_loop, _worker_bot, _worker_sender
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+    _worker_bot = Bot(token, session=AiohttpSession(api=api))
+    _worker_sender = FanOutSender(_worker_bot, global_bucket=global_bucket, **sender_options)
+    # Процессы пула завершаются через os._exit, atexit там не срабатывает
+    multiprocessing.util.Finalize(None, _close_worker_bot, exitpriority=10)
+
+
+def _deliver_shard(messages: List[Tuple[int, str]]) -> FanOutStats:
+    """Точка входа процесса-рассыльщика: отправляет свою часть сообщений"""
+    stats = _worker_loop.run_until_complete(_worker_sender.send_many(messages))
+    stats.errors = {
+        chat_id: DeliveryError(type(error).__name__, str(error)) for chat_id, error in stats.errors.items()
+    }
+    return stats
+
+
+class ShardedSender:
+    """Рассылка в нескольких процессах: сообщения делятся по chat_id, общий лимит и паузы по RetryAfter
+    процессы берут из одного разделяемого token bucket. Цикл событий бота при этом только ждёт результатов
+    и продолжает обрабатывать обновления"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int,
+        global_rate: float = 30,
+        per_chat_rate: float = 1,
+        concurrency: int = 20,
+        max_retries: int = 3,
+        report_every: int = 0
+    ):
+        self.bot = bot
+        self.workers = workers
+        # Результаты из процесса приходят только вместе, поэтому при on_result доля процесса отправляется
+        # частями по report_every сообщений и о каждой части сообщается сразу (0 — одной частью)
+        self.report_every = report_every
+        # spawn: форк процесса с работающим циклом событий и потоками небезопасен
+        self._context = multiprocessing.get_context("spawn")
+        self.global_bucket = SharedTokenBucket(global_rate, context=self._context)
+        self.sender_options = dict(
+            per_chat_rate=per_chat_rate,
+            concurrency=max(1, concurrency // workers),
+            max_retries=max_retries
+        )
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=self._context,
+                initializer=_init_worker,
+                initargs=(self.bot.token, self.bot.session.api, self.global_bucket, self.sender_options)
+            )
+        return self._executor
+
+    def warm_up(self) -> List[Future]:
+        # Процессы запускаются и импортируют зависимости заранее, а не на первой рассылке
+        executor = self._get_executor()
+        return [executor.submit(_warm_up) for _ in range(self.workers)]
+
+    async def send_many(
+        self,
+        messages: Iterable[Tuple[int, str]],
+        on_result: Optional[ResultCallback] = None
+    ) -> FanOutStats:
+        # Все сообщения одного чата попадают в один процесс, чтобы лимит на чат соблюдался
+        shards: List[List[Tuple[int, str]]] = [[] for _ in range(self.workers)]
+        for chat_id, text in messages:
+            shards[chat_id % self.workers].append((chat_id, text))
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+
+        async def deliver(shard: List[Tuple[int, str]]) -> FanOutStats:
+            step = self.report_every if on_result and self.report_every > 0 else len(shard)
+            shard_stats = FanOutStats()
+            for start in range(0, len(shard), step):
+                part = await loop.run_in_executor(executor, _deliver_shard, shard[start:start + step])
+                if on_result:
+                    for chat_id in part.delivered:
+                        on_result(chat_id, None)
+                    for chat_id, error in part.errors.items():
+                        on_result(chat_id, error)
+                shard_stats.merge(part)
+            return shard_stats
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(deliver(shard) for shard in shards if shard))
+
+        stats = FanOutStats(duration=time.monotonic() - started)
+        for shard_stats in results:
+            stats.merge(shard_stats)
+
+        # Метрики процессов-рассыльщиков в их собственных реестрах, учитываем их здесь
+        REMINDERS_SENT.inc(stats.sent)
+        REMINDERS_FAILED.inc(stats.failed)
+        REMINDERS_RETRIED.inc(stats.retried)
+        for latency in stats.latencies:
+            REMINDER_DELIVERY_LATENCY.observe(latency)
+        return stats
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,95 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Поля, которые можно передать в extra= и которые попадут в JSON-запись
+STRUCTURED_FIELDS = ("event_id", "reminder_type", "user_id", "duration")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in STRUCTURED_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _LoopQueueHandler(QueueHandler):
+    """Кладёт запись в очередь, а форматирование и запись в поток делает поток QueueListener"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы и трейсбек превращаем в строки сразу: объекты могут измениться, пока запись ждёт в очереди
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text") -> QueueListener:
+    """Обработчики корневого логгера только ставят записи в очередь, в поток их пишет отдельный поток"""
+    if fmt not in ("text", "json"):
+        raise ValueError(f"Неизвестный формат логов: {fmt}")
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_LoopQueueHandler(log_queue))
+    root.setLevel(level.upper())
+
+    listener.start()
+    # Дописываем всё, что осталось в очереди, даже если процесс завершается с ошибкой
+    atexit.register(listener.stop)
+    return listener
+
+
+def log_delivery_failures(
+    logger: logging.Logger,
+    errors: Dict[int, Exception],
+    samples: int,
+    extra: Optional[dict] = None
+):
+    """Ошибки рассылки одной сводкой по причинам и не больше samples записей о конкретных пользователях,
+    чтобы число строк в логе не росло с числом получателей"""
+    if not errors:
+        return
+    extra = extra or {}
+
+    reasons = Counter(f"{type(error).__name__}: {error}" for error in errors.values())
+    summary = "; ".join(f"{reason} — {count}" for reason, count in reasons.most_common(5))
+    if len(reasons) > 5:
+        summary += f"; других причин: {len(reasons) - 5}"
+    logger.warning(f"Не удалось отправить {len(errors)} сообщений: {summary}", extra=extra)
+
+    for user_id, error in list(errors.items())[:samples]:
+        logger.warning(
+            f"Не удалось отправить напоминание пользователю {user_id}: {error}",
+            extra={**extra, "user_id": user_id}
+        )
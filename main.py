@@ -1,42 +1,154 @@
+import time
+
+# Время импорта зависимостей (в основном aiogram) попадает в сводку времени запуска
+_IMPORT_STARTED = time.perf_counter()
+
 import asyncio
 import logging
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
 from config import config
-from database import Database
+from database import Database, EngineProfile
 from scheduler import ReminderScheduler
-from bot.handlers import event, callbacks, admin
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from bot.counter_updater import CounterUpdater
+from bot.middlewares import StartupGateMiddleware, setup_metrics_middleware
+from bot.storage import create_fsm_storage
+from bot.throttling import (
+    DuplicateCallbackMiddleware, ThrottlingMiddleware, create_throttle_store, setup_throttling_middleware
 )
+from bot.handlers import event, callbacks, admin, start
+from logging_setup import setup_logging
+from metrics import REGISTRY, instrument_database, start_metrics_server
+
+_IMPORT_FINISHED = time.perf_counter()
+
 logger = logging.getLogger(__name__)
 
 
-async def on_startup(bot: Bot, db: Database, scheduler: ReminderScheduler):
-    logger.info("Инициализация базы данных...")
-    await db.init_db()
+class StartupTimer:
+    def __init__(self):
+        self.phases: List[Tuple[str, float]] = [("импорт модулей", _IMPORT_FINISHED - _IMPORT_STARTED)]
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
 
-    logger.info("Запуск планировщика напоминаний...")
-    scheduler.start()
+    def summary(self) -> str:
+        return ", ".join(f"{name}: {seconds:.2f} с" for name, seconds in self.phases)
 
-    logger.info("Перепланирование существующих напоминаний...")
-    await scheduler.reschedule_all_reminders()
 
-    logger.info("Бот запущен!")
+def log_time_to_serve():
+    logger.info(f"Приём обновлений начинается через {time.perf_counter() - _IMPORT_STARTED:.2f} с после запуска")
 
 
-async def on_shutdown(scheduler: ReminderScheduler):
+async def on_startup(db: Database, scheduler: ReminderScheduler, db_ready: asyncio.Future, timer: StartupTimer):
+    # Выполняется в фоне, пока бот уже принимает обновления; обновления ждут только готовности базы
+    try:
+        with timer.phase("инициализация базы"):
+            await db.init_db()
+    except Exception as e:
+        logger.error(f"Ошибка инициализации базы данных: {e}")
+        db_ready.set_exception(e)
+        # Ошибку получат обновления, ожидающие запуска; если их не было, asyncio не должен жаловаться на неё при выходе
+        db_ready.exception()
+        raise
+    db_ready.set_result(None)
+
+    try:
+        with timer.phase("запуск планировщика"):
+            scheduler.start()
+
+        with timer.phase("подготовка напоминаний"):
+            await scheduler.backfill_reminder_rules()
+            # Первая проверка запускается сразу: она же дошлёт напоминания, прерванные перезапуском
+            scheduler.schedule_dispatcher()
+            scheduler.schedule_cleanup()
+    except Exception as e:
+        logger.error(f"Ошибка запуска планировщика напоминаний: {e}")
+        raise
+
+    logger.info(f"Бот запущен! Время запуска — {timer.summary()}")
+
+
+async def on_shutdown(db: Database, scheduler: ReminderScheduler, counter_updater: CounterUpdater):
     logger.info("Остановка планировщика...")
     scheduler.stop()
+    await counter_updater.close()
+    logger.info(f"Кэш мероприятий: {db.event_cache.stats()}")
     logger.info("Бот остановлен!")
 
 
+def create_database(db_url: str) -> Database:
+    return Database(
+        db_url,
+        cache_size=config.EVENT_CACHE_SIZE,
+        cache_ttl=config.EVENT_CACHE_TTL,
+        participant_batch_ms=config.PARTICIPANT_WRITE_BATCH_MS,
+        engine_profile=EngineProfile(
+            journal_mode=config.SQLITE_JOURNAL_MODE,
+            synchronous=config.SQLITE_SYNCHRONOUS,
+            busy_timeout_ms=config.SQLITE_BUSY_TIMEOUT_MS,
+            cache_size_kb=config.SQLITE_CACHE_SIZE_KB,
+            sqlite_pool_size=config.SQLITE_POOL_SIZE,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_recycle=config.DB_POOL_RECYCLE
+        )
+    )
+
+
+def create_dispatcher(bot: Bot, db: Database, db_ready: asyncio.Future) -> Tuple[Dispatcher, Optional[object]]:
+    """Диспетчер со всеми роутерами и middleware бота; нагрузочный тест собирает его так же.
+    Возвращает диспетчер и хранилище защиты от флуда (его нужно закрыть при остановке)"""
+    storage = create_fsm_storage(config.FSM_STORAGE, db, ttl=config.FSM_STATE_TTL, redis_url=config.REDIS_URL)
+
+    # FSM-middleware читает состояние из хранилища (при FSM_STORAGE=database — из базы), поэтому
+    # регистрируем его вручную после middleware, которое придерживает обновления до готовности базы
+    dp = Dispatcher(storage=storage, disable_fsm=True)
+    dp.update.outer_middleware(StartupGateMiddleware(db_ready))
+    dp.update.outer_middleware(dp.fsm)
+
+    dp.include_router(start.router)
+    dp.include_router(event.router)
+    dp.include_router(callbacks.router)
+    dp.include_router(admin.router)
+
+    if config.METRICS_ENABLED:
+        setup_metrics_middleware(start.router, event.router, callbacks.router, admin.router)
+
+    throttle_store = None
+    if config.THROTTLE_ENABLED:
+        throttle_store = create_throttle_store(config.THROTTLE_STORAGE, config.THROTTLE_WINDOW, config.REDIS_URL)
+        throttling = ThrottlingMiddleware(
+            throttle_store,
+            user_limit=config.THROTTLE_USER_LIMIT,
+            chat_limit=config.THROTTLE_CHAT_LIMIT
+        )
+        setup_throttling_middleware(
+            bot,
+            throttling,
+            start.router, event.router, callbacks.router, admin.router,
+            duplicates=DuplicateCallbackMiddleware(config.THROTTLE_DUPLICATE_TTL),
+            # Повторное «🔔 Напомнить» ничего не меняет, поэтому ему можно отдать прежний ответ
+            idempotent_routers=[callbacks.router]
+        )
+
+    return dp, throttle_store
+
+
 async def main():
+    # Запись логов в поток идёт в отдельном потоке и не блокирует цикл событий
+    setup_logging(config.LOG_LEVEL, config.LOG_FORMAT)
+
     try:
         config.validate()
     except ValueError as e:
@@ -44,27 +156,79 @@ async def main():
         logger.error("Создайте файл .env и заполните необходимые переменные")
         return
 
-    db = Database(config.DATABASE_URL)
+    db = create_database(config.DATABASE_URL)
+
+    if config.METRICS_ENABLED:
+        REGISTRY.enabled = True
+        instrument_database(db)
 
     bot = Bot(
         token=config.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    db_ready = asyncio.get_running_loop().create_future()
+    dp, throttle_store = create_dispatcher(bot, db, db_ready)
 
     scheduler = ReminderScheduler(bot, db)
-
-    dp.include_router(event.router)
-    dp.include_router(callbacks.router)
-    dp.include_router(admin.router)
-
-    await on_startup(bot, db, scheduler)
-
+    counter_updater = CounterUpdater(bot, db, interval=config.KEYBOARD_UPDATE_INTERVAL)
+
+    timer = StartupTimer()
+    startup_task = asyncio.create_task(on_startup(db, scheduler, db_ready, timer))
+
+    workflow_data = dict(db=db, scheduler=scheduler, counter_updater=counter_updater)
+    metrics_runner = None
+
+    async def serve():
+        nonlocal metrics_runner
+        if config.WEBHOOK_URL:
+            logger.info("Режим работы: вебхук")
+            from webhook import run_webhook
+
+            log_time_to_serve()
+            await run_webhook(
+                dp,
+                bot,
+                base_url=config.WEBHOOK_URL,
+                path=config.WEBHOOK_PATH,
+                host=config.WEBAPP_HOST,
+                port=config.WEBAPP_PORT,
+                secret_token=config.WEBHOOK_SECRET,
+                metrics_path=config.METRICS_PATH if config.METRICS_ENABLED else None,
+                **workflow_data
+            )
+        else:
+            logger.info("Режим работы: long polling")
+            if config.METRICS_ENABLED:
+                metrics_runner = await start_metrics_server(
+                    config.WEBAPP_HOST, config.WEBAPP_PORT, config.METRICS_PATH
+                )
+                logger.info(f"Метрики доступны на {config.WEBAPP_HOST}:{config.WEBAPP_PORT}{config.METRICS_PATH}")
+            # Если раньше был установлен вебхук, getUpdates без его удаления не работает
+            await bot.delete_webhook()
+            log_time_to_serve()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types(), **workflow_data)
+
+    serving = asyncio.create_task(serve())
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types(), db=db, scheduler=scheduler)
+        # Бот принимает обновления, пока идёт запуск. Если запуск не удался, без базы или напоминаний
+        # работать нельзя: останавливаем приём обновлений и завершаем процесс с ошибкой, чтобы его перезапустили
+        await asyncio.wait({serving, startup_task}, return_when=asyncio.FIRST_EXCEPTION)
+        if startup_task.done() and startup_task.exception() is not None:
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+            raise startup_task.exception()
+        await serving
     finally:
-        await on_shutdown(scheduler)
+        if not startup_task.done():
+            startup_task.cancel()
+        await on_shutdown(db, scheduler, counter_updater)
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await dp.fsm.storage.close()
+        if throttle_store:
+            await throttle_store.close()
+        # Дописываем отклики, оставшиеся в буфере
+        await db.close()
         await bot.session.close()
 
 
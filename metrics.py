@@ -0,0 +1,169 @@
+import bisect
+import functools
+import inspect
+import time
+from typing import TYPE_CHECKING, Dict, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    """Метрики в текстовом формате Prometheus. Пока enabled=False, запись метрик ничего не делает"""
+
+    def __init__(self):
+        self.enabled = False
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> "Counter":
+        metric = Counter(self, name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> "Histogram":
+        metric = Histogram(self, name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, registry: Registry, name: str, documentation: str, labelnames: Sequence[str]):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    def __init__(
+        self,
+        registry: Registry,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float]
+    ):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: счётчики по корзинам (без накопления), сумма и количество
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for key, (bucket_counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.histogram(
+    "bot_handler_duration_seconds", "Время обработки обновления хендлером", ["handler", "status"]
+)
+DB_QUERY_LATENCY = REGISTRY.histogram(
+    "bot_db_call_duration_seconds", "Время выполнения метода Database", ["method", "status"]
+)
+REMINDERS_SENT = REGISTRY.counter("bot_reminders_sent_total", "Доставленные напоминания")
+REMINDERS_FAILED = REGISTRY.counter("bot_reminders_failed_total", "Напоминания, которые не удалось доставить")
+REMINDERS_RETRIED = REGISTRY.counter("bot_reminders_retried_total", "Повторные попытки отправки напоминаний")
+REMINDER_DELIVERY_LATENCY = REGISTRY.histogram(
+    "bot_reminder_delivery_seconds", "Время доставки одного напоминания с учётом ожидания лимитов и повторов"
+)
+
+
+def instrument_database(db):
+    """Оборачивает публичные async-методы экземпляра Database замером времени"""
+    for name, method in inspect.getmembers(db, inspect.iscoroutinefunction):
+        if name.startswith("_"):
+            continue
+        setattr(db, name, _timed(name, method))
+    return db
+
+
+def _timed(name: str, method):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await method(*args, **kwargs)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - started, method=name, status=status)
+
+    return wrapper
+
+
+async def handle_metrics(request: "web.Request") -> "web.Response":
+    # aiohttp.web нужен только для отдачи метрик, поэтому импортируется при первом запросе
+    from aiohttp import web
+
+    return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int, path: str = "/metrics") -> "web.AppRunner":
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get(path, handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    return runner
@@ -1,123 +1,519 @@
+import asyncio
+import html
 import logging
 from datetime import datetime, timedelta
+from string import Template
+from typing import Dict, List, Optional, Tuple
 from zoneinfo import ZoneInfo
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.date import DateTrigger
 from aiogram import Bot
+from sqlalchemy import or_
+from sqlalchemy.engine import make_url
 
-from database import Database
+from config import config
+from database import Database, Event, ReminderOutbox, ReminderRule
+from delivery import FanOutSender, FanOutStats, ShardedSender, is_undeliverable
+from logging_setup import log_delivery_failures
 
 logger = logging.getLogger(__name__)
 
 # Московский часовой пояс
 MOSCOW_TZ = ZoneInfo("Europe/Moscow")
 
+OFFSET_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_offsets(spec: str) -> Dict[str, timedelta]:
+    """'24h,3h,30m' -> {'24h': 24 часа, '3h': 3 часа, '30m': 30 минут}; тип напоминания — его запись"""
+    offsets = {}
+    for item in spec.split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        value, unit = item[:-1], item[-1]
+        if unit not in OFFSET_UNITS or not value.isdigit() or int(value) <= 0:
+            raise ValueError(f"Неверное смещение напоминания: {item}")
+        offsets[item] = timedelta(**{OFFSET_UNITS[unit]: int(value)})
+    return offsets
+
+
+def _plural(number: int, one: str, few: str, many: str) -> str:
+    if number % 10 == 1 and number % 100 != 11:
+        return one
+    if 2 <= number % 10 <= 4 and not 12 <= number % 100 <= 14:
+        return few
+    return many
+
+
+def format_offset(offset: timedelta) -> str:
+    minutes = int(offset.total_seconds() // 60)
+    if minutes % (24 * 60) == 0:
+        days = minutes // (24 * 60)
+        return f"{days} {_plural(days, 'день', 'дня', 'дней')}"
+    if minutes % 60 == 0:
+        hours = minutes // 60
+        return f"{hours} {_plural(hours, 'час', 'часа', 'часов')}"
+    return f"{minutes} {_plural(minutes, 'минуту', 'минуты', 'минут')}"
+
+
+def parse_chat_offsets(spec: str) -> Dict[int, Dict[str, timedelta]]:
+    """'-1001=48h,1h;-1002=2h' -> смещения напоминаний для отдельных чатов"""
+    result = {}
+    for item in spec.split(";"):
+        if "=" in item:
+            chat_id, offsets = item.split("=", 1)
+            result[int(chat_id.strip())] = parse_offsets(offsets)
+    return result
+
+
+# За сколько до начала мероприятия отправляется напоминание каждого типа
+REMINDER_OFFSETS = parse_offsets(config.REMINDER_OFFSETS)
+CHAT_REMINDER_OFFSETS = parse_chat_offsets(config.CHAT_REMINDER_OFFSETS)
+
+# Шаблоны текстов напоминаний. Значения подставляются уже экранированными для HTML
+REMINDER_TEMPLATES = {
+    "24h": Template(
+        "🔔 Напоминание: завтра состоится встреча на тему: <b>$title</b> в <b>$time</b>. Ждём вас!"
+    ),
+    "3h": Template(
+        "🔔 Напоминаем: через 3 часа начнётся встреча на тему: <b>$title</b> по адресу <b>$address</b>. До встречи!"
+    ),
+}
+DEFAULT_REMINDER_TEMPLATE = Template(
+    "🔔 Напоминаем: через $offset начнётся встреча на тему: <b>$title</b> по адресу <b>$address</b>. До встречи!"
+)
+
+
+def offsets_for_chat(chat_id: Optional[int]) -> Dict[str, timedelta]:
+    return CHAT_REMINDER_OFFSETS.get(chat_id, REMINDER_OFFSETS)
+
+
+def _moscow_naive(dt: datetime) -> datetime:
+    # Даты мероприятий хранятся как московское время без часового пояса
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(MOSCOW_TZ).replace(tzinfo=None)
+    return dt
+
+
+def render_reminder(reminder_type: str, offset: timedelta, title: str, address: str, date_time: datetime) -> str:
+    template = REMINDER_TEMPLATES.get(reminder_type, DEFAULT_REMINDER_TEMPLATE)
+    return template.substitute(
+        title=html.escape(title),
+        address=html.escape(address),
+        time=date_time.strftime("%H:%M"),
+        offset=format_offset(offset)
+    )
+
+
+def build_reminder_rules(
+    date_time: datetime,
+    title: str,
+    address: str,
+    chat_id: Optional[int] = None
+) -> List[ReminderRule]:
+    """Напоминания нового мероприятия с уже подставленным текстом — при отправке он не пересобирается"""
+    date_time = _moscow_naive(date_time)
+    return [
+        ReminderRule(
+            reminder_type=reminder_type,
+            offset_minutes=int(offset.total_seconds() // 60),
+            text=render_reminder(reminder_type, offset, title, address, date_time),
+            fire_at=date_time - offset
+        )
+        for reminder_type, offset in offsets_for_chat(chat_id).items()
+    ]
+
+# Задания прежних версий: по два DateTrigger на мероприятие и разовый разбор очереди после запуска
+LEGACY_JOB_PREFIXES = ("reminder_24h_", "reminder_3h_", "outbox_resume")
+
+# Задания в постоянном хранилище APScheduler ссылаются на функции модуля по имени,
+# поэтому методы активного планировщика вызываются через эти обёртки
+_active_scheduler: Optional["ReminderScheduler"] = None
+
+
+async def run_dispatch_due():
+    await _active_scheduler.dispatch_due_reminders()
+
+
+async def run_cleanup():
+    await _active_scheduler.cleanup_old_events()
+
+
+class _DeliveryMarker:
+    """Отмечает строки очереди по мере рассылки, частями по every результатов, а не после всей пачки.
+    Доставка остаётся «хотя бы один раз»: если процесс упадёт, после перезапуска повторно уйдут только
+    сообщения из ещё не записанной части"""
+
+    def __init__(self, db: Database, rows_by_user: Dict[int, List[int]], every: int):
+        self.db = db
+        self.rows_by_user = rows_by_user
+        self.every = max(every, 1)
+        self.undeliverable = 0
+        self._delivered: List[int] = []
+        self._errors: Dict[int, Exception] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def record(self, user_id: int, error: Optional[Exception]):
+        if error is None:
+            self._delivered.append(user_id)
+        else:
+            self._errors[user_id] = error
+        # Записи идут по одной, пока рассылка продолжается; накопившееся за время записи уйдёт следующей
+        if len(self._delivered) + len(self._errors) >= self.every and (
+            self._flush_task is None or self._flush_task.done()
+        ):
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        delivered, self._delivered = self._delivered, []
+        errors, self._errors = self._errors, {}
+
+        await self.db.mark_reminders(
+            [row_id for user_id in delivered for row_id in self.rows_by_user[user_id]],
+            ReminderOutbox.STATUS_SENT
+        )
+        await self.db.mark_reminders(
+            [row_id for user_id in errors for row_id in self.rows_by_user[user_id]],
+            ReminderOutbox.STATUS_FAILED
+        )
+
+        undeliverable = {user_id: str(error) for user_id, error in errors.items() if is_undeliverable(error)}
+        # Следующие рассылки их пропустят, пока пользователь снова не отправит боту /start
+        await self.db.mark_undeliverable(undeliverable)
+        self.undeliverable += len(undeliverable)
+
+    async def close(self):
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._flush()
+
+
+def sync_database_url(db_url: str) -> str:
+    # APScheduler 3 работает с синхронным SQLAlchemy: sqlite+aiosqlite -> sqlite, postgresql+asyncpg -> postgresql
+    url = make_url(db_url)
+    return url.set(drivername=url.get_backend_name()).render_as_string(hide_password=False)
+
 
 class ReminderScheduler:
     def __init__(self, bot: Bot, db: Database):
+        global _active_scheduler
+        _active_scheduler = self
+
         self.bot = bot
         self.db = db
-        self.scheduler = AsyncIOScheduler()
+        self.persistent = config.SCHEDULER_JOBSTORE == "database"
+
+        jobstores = {}
+        self.jobstore = None
+        if self.persistent:
+            # Импорт постоянного хранилища заданий тянет синхронный SQLAlchemy — только когда оно нужно
+            from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+
+            self.jobstore = jobstores["default"] = SQLAlchemyJobStore(url=sync_database_url(config.DATABASE_URL))
+
+        self.scheduler = AsyncIOScheduler(
+            jobstores=jobstores,
+            job_defaults={
+                "misfire_grace_time": config.SCHEDULER_MISFIRE_GRACE,
+                "coalesce": config.SCHEDULER_COALESCE
+            }
+        )
+        sender_options = dict(
+            global_rate=config.REMINDER_RATE_LIMIT,
+            per_chat_rate=config.REMINDER_PER_CHAT_RATE,
+            concurrency=config.REMINDER_CONCURRENCY,
+            max_retries=config.REMINDER_MAX_RETRIES
+        )
+        if config.DELIVERY_WORKERS > 0:
+            self.sender = ShardedSender(
+                bot,
+                workers=config.DELIVERY_WORKERS,
+                report_every=config.REMINDER_MARK_EVERY,
+                **sender_options
+            )
+        else:
+            self.sender = FanOutSender(bot, **sender_options)
+        self._drain_lock = asyncio.Lock()
+        self._drain_task: Optional[asyncio.Task] = None
+        self._drain_requested = False
 
     def start(self):
+        if self.jobstore is not None:
+            self._remove_legacy_jobs()
         self.scheduler.start()
+        if isinstance(self.sender, ShardedSender):
+            self.sender.warm_up()
         logger.info("Планировщик напоминаний запущен")
 
     def stop(self):
-        self.scheduler.shutdown()
+        # Планировщик запускается в фоне после старта приёма обновлений и может не успеть запуститься
+        if self.scheduler.running:
+            self.scheduler.shutdown()
+        if self._drain_task is not None:
+            # Неотмеченные строки очереди остаются в статусе pending и будут отправлены после запуска
+            self._drain_task.cancel()
+        if isinstance(self.sender, ShardedSender):
+            self.sender.close()
         logger.info("Планировщик напоминаний остановлен")
 
-    async def send_reminder(self, event_id: int, reminder_type: str):
-        logger.info(f"Запуск отправки напоминания типа {reminder_type} для мероприятия {event_id}")
-        try:
-            event = await self.db.get_event(event_id)
-            if not event:
-                logger.warning(f"Мероприятие {event_id} не найдено")
-                return
+    def _remove_legacy_jobs(self):
+        # Задания прежних версий ссылаются на функции, которых больше нет, и из хранилища не восстанавливаются.
+        # Удаляем их строки до запуска планировщика: иначе APScheduler запишет в лог трейсбек на каждое.
+        # Напоминания этих мероприятий отправит периодическая проверка по правилам из reminder_rules
+        table = self.jobstore.jobs_t
+        with self.jobstore.engine.begin() as conn:
+            table.create(conn, checkfirst=True)
+            result = conn.execute(
+                table.delete().where(or_(*(
+                    table.c.id.startswith(prefix, autoescape=True) for prefix in LEGACY_JOB_PREFIXES
+                )))
+            )
+        if result.rowcount:
+            logger.info(f"Удалено заданий прежних версий: {result.rowcount}")
 
-            participants = await self.db.get_participants_by_event(event_id)
-            logger.info(f"Найдено {len(participants)} участников для мероприятия {event_id}")
+    @staticmethod
+    def render_digest(items: List[Tuple[Event, str]]) -> str:
+        lines = ["🔔 Напоминаем о ваших ближайших встречах:", ""]
+        for event, _ in sorted(items, key=lambda item: item[0].date_time):
+            lines.append(
+                f'• <b>{html.escape(event.title)}</b> — {event.date_time.strftime("%d.%m в %H:%M")}, '
+                f"<b>{html.escape(event.address)}</b>"
+            )
+        lines.extend(["", "Ждём вас!"])
+        return "\n".join(lines)
 
-            if not participants:
-                logger.info(f"Нет участников для отправки напоминаний по мероприятию {event_id}")
-                return
+    @staticmethod
+    def has_started(event: Event) -> bool:
+        event_datetime = event.date_time
+        if event_datetime.tzinfo is None:
+            event_datetime = event_datetime.replace(tzinfo=MOSCOW_TZ)
+        return event_datetime <= datetime.now(MOSCOW_TZ)
 
-            if reminder_type == "24h":
-                message_text = (
-                    f"🔔 Напоминание: завтра состоится встреча на тему: "
-                    f'<b>{event.title}</b> в <b>{event.date_time.strftime("%H:%M")}</b>. Ждём вас!'
-                )
-            elif reminder_type == "3h":
-                message_text = (
-                    f'🔔 Напоминаем: через 3 часа начнётся встреча на тему: <b>{event.title}</b> '
-                    f"по адресу <b>{event.address}</b>. До встречи!"
+    async def _enqueue_digest_companions(self, event_ids: List[int]):
+        # Напоминания, которые сработают в ближайшие REMINDER_DIGEST_WINDOW_MINUTES минут, ставим в очередь
+        # сейчас и только участникам этих мероприятий — разборщик сольёт их в одно сообщение на человека.
+        # Когда их правила сработают, очередь уже будет содержать эти строки и дублей не будет
+        now = _moscow_naive(datetime.now(MOSCOW_TZ))
+        window_end = now + timedelta(minutes=config.REMINDER_DIGEST_WINDOW_MINUTES)
+
+        for rule in await self.db.get_reminder_rules_between(now, window_end):
+            queued = await self.db.enqueue_reminders(
+                rule.event_id, rule.reminder_type, only_participants_of=event_ids
+            )
+            if queued:
+                logger.info(
+                    f"Для сводки досрочно поставлено {queued} напоминаний {rule.reminder_type} "
+                    f"для мероприятия {rule.event_id}"
                 )
-            else:
-                logger.warning(f"Неизвестный тип напоминания: {reminder_type}")
+
+    def start_drain(self) -> asyncio.Task:
+        """Запускает разбор очереди отдельной задачей (или просит идущий разбор пройтись ещё раз) и возвращает её"""
+        self._drain_requested = True
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain_in_background())
+        return self._drain_task
+
+    async def _drain_in_background(self):
+        # Пока идёт разбор, тики продолжают ставить напоминания в очередь. Если новые строки появились,
+        # когда разбор уже увидел пустую очередь, он проходит её ещё раз, а не ждёт следующего тика
+        while self._drain_requested:
+            self._drain_requested = False
+            try:
+                await self.drain_outbox()
+            except Exception as e:
+                logger.error(f"Ошибка при рассылке напоминаний: {e}")
                 return
 
-            sent_count = 0
-            failed_count = 0
-
-            for participant in participants:
-                try:
-                    await self.bot.send_message(
-                        chat_id=participant.user_id,
-                        text=message_text,
-                        parse_mode="HTML"
-                    )
-                    sent_count += 1
-                except Exception as e:
-                    logger.error(
-                        f"Не удалось отправить напоминание пользователю {participant.user_id}: {e}"
-                    )
-                    failed_count += 1
+    async def drain_outbox(self):
+        # Один разборщик за раз, иначе две задачи могут взять одни и те же строки
+        async with self._drain_lock:
+            while True:
+                rows = await self.db.get_pending_reminders(config.REMINDER_OUTBOX_BATCH)
+                if not rows:
+                    return
 
-            logger.info(
-                f"Отправлено напоминаний: {sent_count}, не удалось отправить: {failed_count}"
-            )
+                groups: Dict[Tuple[int, str], List[ReminderOutbox]] = {}
+                for row in rows:
+                    groups.setdefault((row.event_id, row.reminder_type), []).append(row)
 
-        except Exception as e:
-            logger.error(f"Ошибка при отправке напоминаний: {e}")
+                if config.REMINDER_DIGEST_WINDOW_MINUTES > 0:
+                    await self._deliver_digests(groups)
+                    continue
 
-    def schedule_reminders(self, event_id: int, event_datetime: datetime):
-        # Убеждаемся, что event_datetime имеет часовой пояс
-        if event_datetime.tzinfo is None:
-            event_datetime = event_datetime.replace(tzinfo=MOSCOW_TZ)
+                # Группы отправляются параллельно и делят общий лимит: небольшое напоминание не ждёт большое
+                await asyncio.gather(*(
+                    self._deliver_group(event_id, reminder_type, group)
+                    for (event_id, reminder_type), group in groups.items()
+                ))
+
+    async def _prepare_group(
+        self,
+        event_id: int,
+        reminder_type: str,
+        rows: List[ReminderOutbox]
+    ) -> Optional[Tuple[Event, str]]:
+        """Мероприятие и текст напоминания, если группу можно отправлять; иначе строки помечаются и возвращается None"""
+        row_ids = [row.id for row in rows]
+
+        event = await self.db.get_event(event_id)
+        if not event:
+            logger.warning(f"Мероприятие {event_id} не найдено")
+            await self.db.mark_reminders(row_ids, ReminderOutbox.STATUS_FAILED)
+            return None
+
+        if self.has_started(event):
+            logger.info(f"Мероприятие {event_id} уже началось, напоминания {reminder_type} не отправляются")
+            await self.db.mark_reminders(row_ids, ReminderOutbox.STATUS_EXPIRED)
+            return None
+
+        rule = await self.db.get_reminder_rule(event_id, reminder_type)
+        if rule is None:
+            logger.warning(f"Для мероприятия {event_id} нет напоминания типа {reminder_type}")
+            await self.db.mark_reminders(row_ids, ReminderOutbox.STATUS_FAILED)
+            return None
+
+        return event, rule.text
 
-        reminder_24h = event_datetime - timedelta(hours=24)
-        reminder_3h = event_datetime - timedelta(hours=3)
+    async def _send_and_mark(
+        self,
+        messages: List[Tuple[int, str]],
+        rows_by_user: Dict[int, List[int]],
+        extra: Optional[dict] = None
+    ) -> FanOutStats:
+        marker = _DeliveryMarker(self.db, rows_by_user, config.REMINDER_MARK_EVERY)
+        try:
+            stats = await self.sender.send_many(messages, on_result=marker.record)
+        finally:
+            # Отмечаем доставленное, даже если рассылка прервалась
+            await marker.close()
+
+        extra = {**(extra or {}), "duration": round(stats.duration, 3)}
+        log_delivery_failures(logger, stats.errors, config.LOG_FAILURE_SAMPLES, extra)
+        if marker.undeliverable:
+            logger.info(f"Пользователей, которым бот не может писать: {marker.undeliverable}", extra=extra)
+        return stats
+
+    async def _deliver_group(self, event_id: int, reminder_type: str, rows: List[ReminderOutbox]):
+        prepared = await self._prepare_group(event_id, reminder_type, rows)
+        if prepared is None:
+            return
+
+        _, message_text = prepared
+        extra = {"event_id": event_id, "reminder_type": reminder_type}
+        stats = await self._send_and_mark(
+            [(row.user_id, message_text) for row in rows],
+            {row.user_id: [row.id] for row in rows},
+            extra
+        )
+        extra["duration"] = round(stats.duration, 3)
+
+        logger.info(f"Напоминания {reminder_type} для мероприятия {event_id}: {stats.summary()}", extra=extra)
+
+    async def _deliver_digests(self, groups: Dict[Tuple[int, str], List[ReminderOutbox]]):
+        # Все напоминания одного пользователя из пачки уходят одним сообщением
+        items_by_user: Dict[int, List[Tuple[Event, str]]] = {}
+        rows_by_user: Dict[int, List[int]] = {}
 
-        # Получаем текущее московское время
-        now = datetime.now(MOSCOW_TZ)
+        for (event_id, reminder_type), rows in groups.items():
+            prepared = await self._prepare_group(event_id, reminder_type, rows)
+            if prepared is None:
+                continue
+            for row in rows:
+                items_by_user.setdefault(row.user_id, []).append(prepared)
+                rows_by_user.setdefault(row.user_id, []).append(row.id)
 
-        if reminder_24h > now:
-            self.scheduler.add_job(
-                self.send_reminder,
-                trigger=DateTrigger(run_date=reminder_24h),
-                args=[event_id, "24h"],
-                id=f"reminder_24h_{event_id}",
-                replace_existing=True
+        if not items_by_user:
+            return
+
+        messages = [
+            (user_id, self.render_digest(items) if len(items) > 1 else items[0][1])
+            for user_id, items in items_by_user.items()
+        ]
+        stats = await self._send_and_mark(messages, rows_by_user)
+        extra = {"duration": round(stats.duration, 3)}
+
+        logger.info(
+            f"Напоминания по {sum(len(ids) for ids in rows_by_user.values())} записям очереди "
+            f"отправлены {len(messages)} сообщениями: {stats.summary()}",
+            extra=extra
+        )
+
+    async def cleanup_old_events(self):
+        before = datetime.now() - timedelta(days=config.EVENT_RETENTION_DAYS)
+        try:
+            deleted_events, deleted_participants = await self.db.delete_old_events(
+                before=before,
+                batch_size=config.CLEANUP_BATCH_SIZE
             )
-            logger.info(f"Запланировано напоминание за 24 часа для мероприятия {event_id}")
-
-        if reminder_3h > now:
-            self.scheduler.add_job(
-                self.send_reminder,
-                trigger=DateTrigger(run_date=reminder_3h),
-                args=[event_id, "3h"],
-                id=f"reminder_3h_{event_id}",
-                replace_existing=True
+            logger.info(
+                f"Автоочистка: удалено мероприятий: {deleted_events}, записей участников: {deleted_participants}"
             )
-            logger.info(f"Запланировано напоминание за 3 часа для мероприятия {event_id}")
+        except Exception as e:
+            logger.error(f"Ошибка при автоочистке старых мероприятий: {e}")
+
+    def schedule_cleanup(self):
+        if config.CLEANUP_INTERVAL_HOURS <= 0:
+            return
+        from apscheduler.triggers.interval import IntervalTrigger
+
+        self.scheduler.add_job(
+            run_cleanup,
+            trigger=IntervalTrigger(hours=config.CLEANUP_INTERVAL_HOURS),
+            id="cleanup_old_events",
+            replace_existing=True
+        )
+        logger.info(f"Автоочистка старых мероприятий запланирована раз в {config.CLEANUP_INTERVAL_HOURS} ч")
+
+    async def dispatch_due_reminders(self):
+        """Ставит в очередь все наступившие напоминания одним проходом и запускает рассылку в фоне"""
+        now = _moscow_naive(datetime.now(MOSCOW_TZ))
+        # Напоминания, время которых пришлось на простой бота, отправляются, если опоздали не больше чем на это
+        lookback = timedelta(seconds=config.SCHEDULER_MISFIRE_GRACE)
 
-    async def reschedule_all_reminders(self):
         try:
-            events = await self.db.get_upcoming_events()
-            logger.info(f"Перепланирование напоминаний для {len(events)} мероприятий")
+            rules = await self.db.get_reminder_rules_between(now - lookback, now)
+            if rules:
+                queued = await self.db.enqueue_rule_reminders(rules)
+                logger.info(
+                    f"В очередь поставлено {queued} напоминаний: "
+                    + ", ".join(f"{rule.reminder_type} для мероприятия {rule.event_id}" for rule in rules)
+                )
 
-            for event in events:
-                self.schedule_reminders(event.id, event.date_time)
+                if config.REMINDER_DIGEST_WINDOW_MINUTES > 0:
+                    await self._enqueue_digest_companions(list({rule.event_id for rule in rules}))
 
         except Exception as e:
-            logger.error(f"Ошибка при перепланировании напоминаний: {e}")
+            logger.error(f"Ошибка при постановке напоминаний в очередь: {e}")
+            return
+
+        # Рассылка идёт отдельной задачей: большая рассылка не должна задерживать следующие тики,
+        # иначе APScheduler пропускает их (max_instances=1) и другие наступившие напоминания ждут её конца
+        self.start_drain()
+
+    async def backfill_reminder_rules(self):
+        # Мероприятия, созданные до появления правил напоминаний, получают правила по умолчанию
+        events = await self.db.get_events_without_reminder_rules()
+        if not events:
+            return
+
+        rules = []
+        for event in events:
+            for rule in build_reminder_rules(event.date_time, event.title, event.address, event.chat_id):
+                rule.event_id = event.id
+                rules.append(rule)
+        await self.db.add_reminder_rules(rules)
+        logger.info(f"Созданы напоминания для {len(events)} мероприятий")
+
+    def schedule_dispatcher(self):
+        # Одно периодическое задание вместо пары DateTrigger на каждое мероприятие:
+        # память и время запуска не растут с числом мероприятий
+        from apscheduler.triggers.interval import IntervalTrigger
+
+        self.scheduler.add_job(
+            run_dispatch_due,
+            trigger=IntervalTrigger(seconds=config.REMINDER_TICK_SECONDS),
+            id="reminder_dispatcher",
+            next_run_time=datetime.now(MOSCOW_TZ),
+            replace_existing=True
+        )
+        logger.info(f"Проверка наступивших напоминаний раз в {config.REMINDER_TICK_SECONDS:g} с")
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import Any, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from metrics import handle_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def create_webhook_app(
+    dp: Dispatcher,
+    bot: Bot,
+    path: str = "/webhook",
+    secret_token: Optional[str] = None,
+    metrics_path: Optional[str] = None,
+    **data: Any
+) -> web.Application:
+    """aiohttp-приложение, которое принимает обновления Telegram и передаёт их диспетчеру"""
+    app = web.Application()
+    # handle_in_background: Telegram сразу получает 200, а обновления обрабатываются параллельно
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=secret_token,
+        **data
+    ).register(app, path=path)
+    if metrics_path:
+        app.router.add_get(metrics_path, handle_metrics)
+    return app
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    base_url: str,
+    path: str,
+    host: str,
+    port: int,
+    secret_token: Optional[str] = None,
+    metrics_path: Optional[str] = None,
+    **data: Any
+):
+    app = create_webhook_app(dp, bot, path=path, secret_token=secret_token, metrics_path=metrics_path, **data)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    logger.info(f"Веб-сервер для вебхука слушает {host}:{port}{path}")
+
+    await bot.set_webhook(
+        url=base_url.rstrip("/") + path,
+        secret_token=secret_token,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    logger.info("Вебхук установлен")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()